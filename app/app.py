@@ -1,34 +1,193 @@
 import dash
+import datetime
+import os
 import ssl
-from dash import dcc, html
+import threading
+import time
+from dash import dash_table, dcc, html
 from dash.dependencies import Input, Output, State
 import dash_bootstrap_components as dbc
-import pandas as pd
-from rdflib import Graph
-from rdflib.plugins.sparql import prepareQuery
+from isodate import duration_isoformat
 
 from pyparsing.exceptions import ParseBaseException
 
-# Funciones para cargar y consultar RDF
-def load_rdf(file_path):
-    g = Graph()
-    g.parse(file_path, format="ttl")
-    return g
-
-def query_rdf(g, query):
-    try: 
-        prepared_query = prepareQuery(query)
-        results = g.query(prepared_query)
-        return [dict(zip(row.labels, row)) for row in results]
-    except ParseBaseException as err:
-        return err.explain()
-    
-# Cargar el RDF
-g = load_rdf("output.ttl")
+from cache import QueryCache, estimate_size
+from executor import QueryExecutor, QueryTimeout
+from profiling import QueryProfiler
+from rdf_utils import load_rdf, query_rdf, rows_to_frame, source_fingerprint
+from sparql_endpoint import cached_size, sparql_blueprint
+from views import MaterializedViews, match_route, views_blueprint
+
+# Cargar el RDF (desde el snapshot binario si output.ttl no ha cambiado)
+GRAPH_FILE = "output.ttl"
+g = load_rdf(GRAPH_FILE)
+graph_version = source_fingerprint(GRAPH_FILE)
+graph_lock = threading.Lock()
+
+# Vistas materializadas (similitud, temas, autores): se construyen en el primer
+# uso y no al arrancar, ya que recorren todo el grafo. Se guardan junto al grafo
+# del que salen para no servir las de un grafo anterior tras una recarga.
+views = (None, None)  # (grafo, vistas)
+views_lock = threading.Lock()
+ROUTE_VIEWS = os.environ.get("ROUTE_VIEWS", "1") == "1"
+
+# Caché LRU de resultados, se vacía sola cuando cambia la versión del grafo
+query_cache = QueryCache(
+    max_entries=int(os.environ.get("QUERY_CACHE_ENTRIES", 128)),
+    max_bytes=int(os.environ.get("QUERY_CACHE_MB", 64)) * 1024 * 1024,
+)
+
+# Con gunicorn el grafo lo recarga el proceso maestro (ver gunicorn.conf.py)
+GRAPH_AUTO_RELOAD = os.environ.get("GRAPH_AUTO_RELOAD", "1") == "1"
+
+def reload_graph(force=False):
+    """Vuelve a cargar el grafo si output.ttl ha cambiado (o siempre con `force`)"""
+    global g, graph_version, views
+    version = source_fingerprint(GRAPH_FILE)
+    if force or version != graph_version:
+        with graph_lock:
+            if force or version != graph_version:
+                old = g
+                g = load_rdf(GRAPH_FILE)
+                graph_version = version
+                views = (None, None)  # libera las del grafo anterior
+                # Un almacén en disco deja sus ficheros abiertos si no se cierra
+                old.close()
+    return g, graph_version
+
+def current_graph():
+    """Devuelve el grafo y su versión"""
+    if GRAPH_AUTO_RELOAD:
+        return reload_graph()
+    return g, graph_version
+
+def current_views():
+    """Vistas materializadas del grafo actual
+
+    Con gunicorn las construye el maestro al cargar el grafo (ver
+    gunicorn.conf.py); sin él, la primera consulta que las necesita.
+    """
+    global views
+    graph, _ = current_graph()
+    if views[0] is not graph:
+        with views_lock:
+            if views[0] is not graph:
+                views = (graph, MaterializedViews(graph))
+    return views[1]
+
+def route_to_views(query):
+    """Resuelve la consulta con las vistas materializadas si es una de las canónicas"""
+    # Primero se mira el texto: las demás consultas no esperan a que se construyan las vistas
+    route = match_route(query) if ROUTE_VIEWS else None
+    return current_views().answer(route) if route is not None else None
+
+# Las consultas se ejecutan en un pool con tiempo y número de filas limitados
+QUERY_TIMEOUT = float(os.environ.get("QUERY_TIMEOUT", 30))
+QUERY_MAX_ROWS = int(os.environ.get("QUERY_MAX_ROWS", 10000))
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", 50))
+query_executor = QueryExecutor(
+    max_workers=int(os.environ.get("QUERY_WORKERS", 4)),
+    timeout=QUERY_TIMEOUT,
+)
+
+# Tiempos de cada consulta y registro de las lentas (pestaña Rendimiento y /metrics)
+profiler = QueryProfiler(
+    slow_ms=float(os.environ.get("SLOW_QUERY_MS", 500)),
+    capacity=int(os.environ.get("SLOW_QUERY_LOG", 200)),
+)
+
+def cached_query(query):
+    """Ejecuta la consulta (o la toma de la caché)
+
+    Devuelve un DataFrame con hasta QUERY_MAX_ROWS + 1 filas, la fila extra
+    indica que el resultado se ha truncado. Lanza QueryTimeout si se supera
+    QUERY_TIMEOUT.
+    """
+    graph, version = current_graph()
+    data = query_cache.get(query, version)
+    if data is None:
+        started = time.perf_counter()
+        routed = route_to_views(query)
+        if routed is not None:
+            data = rows_to_frame(*routed)
+            profiler.record("view", query, 0.0, (time.perf_counter() - started) * 1000, len(data))
+            return data
+        timings = {}
+        try:
+            data = query_executor.run(query_rdf, graph, query, max_rows=QUERY_MAX_ROWS + 1, timings=timings)
+        except ParseBaseException as err:
+            profiler.record("ui", query, timings.get('parse_ms', 0.0), 0.0, error="parse error")
+            return err.explain()
+        except QueryTimeout:
+            profiler.record("ui", query, timings.get('parse_ms', 0.0), QUERY_TIMEOUT * 1000, error="timeout")
+            raise
+        except Exception as err:
+            # rdflib lanza Exception sin más para prefijos desconocidos y otros errores
+            profiler.record("ui", query, timings.get('parse_ms', 0.0), timings.get('eval_ms', 0.0),
+                            error=type(err).__name__)
+            return f"Error en la consulta: {err}"
+        profiler.record("ui", query, timings['parse_ms'], timings['eval_ms'], len(data), estimate_size(data))
+        query_cache.put(query, version, data)
+    return data
+
+# Resultados que se están mostrando en la tabla: se fijan fuera de la caché LRU
+# (que puede descartarlos por tamaño) para que paginar u ordenar no vuelva a
+# ejecutar la consulta. Cada uno guarda también las ordenaciones ya calculadas.
+ACTIVE_RESULTS = int(os.environ.get("ACTIVE_RESULTS", 16))
+SORT_ORDERS_PER_RESULT = 4
+active_results = QueryCache(max_entries=ACTIVE_RESULTS, sizeof=lambda value: 0)
+
+def active_result(query):
+    """Resultado activo de la consulta, ejecutándola solo si no está fijado
+
+    Devuelve un diccionario con el DataFrame (`data`, como mucho
+    QUERY_MAX_ROWS + 1 filas) y sus ordenaciones (`orders`), o el mensaje de
+    error si la consulta no es válida. Lanza QueryTimeout.
+    """
+    _, version = current_graph()
+    active = active_results.get(query, version)
+    if active is None:
+        data = cached_query(query)
+        if isinstance(data, str):
+            return data
+        active = {'data': data, 'orders': {}}
+        active_results.put(query, version, active)
+    return active
 
 # Crear la aplicación Dash
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
 
+server = app.server
+
+@server.route("/health")
+def health():
+    graph, version = current_graph()
+    return {"status": "ok", "pid": os.getpid(), "triples": len(graph), "graph_version": list(version)}
+
+# Endpoint SPARQL 1.1 Protocol (/sparql) para scripts, con los mismos límites que la interfaz
+sparql_cache = QueryCache(
+    max_entries=int(os.environ.get("QUERY_CACHE_ENTRIES", 128)),
+    max_bytes=int(os.environ.get("QUERY_CACHE_MB", 64)) * 1024 * 1024,
+    sizeof=cached_size,
+)
+server.register_blueprint(sparql_blueprint(current_graph, query_executor, sparql_cache, QUERY_MAX_ROWS, profiler,
+                                           route_to_views))
+# API JSON sobre las vistas materializadas (/api/...)
+server.register_blueprint(views_blueprint(current_views))
+
+@server.route("/stats/cache")
+def cache_stats():
+    return {"ui": query_cache.stats(), "sparql": sparql_cache.stats()}
+
+@server.route("/metrics")
+def metrics():
+    return {
+        "pid": os.getpid(),
+        "queries": profiler.metrics(),
+        "cache": cache_stats(),
+        "top_offenders": profiler.top_offenders(),
+    }
+
 # Estilos CSS
 styles = {
     'textAlign': 'center',
@@ -44,11 +203,49 @@ app.layout = dbc.Container([
     html.H1("Consulta SPARQL", style={'textAlign': 'center', 'color': '#000000'}),
     dbc.Tabs([
         dbc.Tab(label="Consulta Query", tab_id="query"),
+        dbc.Tab(label="Rendimiento", tab_id="performance"),
         dbc.Tab(label="Sobre Nosotros", tab_id="about"),
     ], id="tabs", active_tab="query"),
     html.Div(id="tab-content", className="p-4")
 ])
 
+def render_performance():
+    """Resumen de tiempos y consultas lentas del proceso actual"""
+    metrics = profiler.metrics()
+    summary = [
+        ("Consultas ejecutadas", metrics['queries']),
+        ("Consultas lentas / con error", f"{metrics['slow_queries']} / {metrics['errors']}"),
+        ("Umbral de consulta lenta", f"{metrics['slow_threshold_ms']:g} ms"),
+        ("Latencia p50 / p95 / máx.", f"{metrics['p50_ms']:.1f} / {metrics['p95_ms']:.1f} / {metrics['max_ms']:.1f} ms"),
+        ("Tiempo de parseo / evaluación", f"{metrics['parse_ms_total']:.1f} / {metrics['eval_ms_total']:.1f} ms"),
+        ("Aciertos de la caché", f"{query_cache.stats()['hit_rate']:.0%}"),
+    ]
+    offenders = [
+        {
+            'Consulta': group['query'],
+            'Veces': group['count'],
+            'Total (ms)': round(group['total_ms'], 1),
+            'Media (ms)': round(group['avg_ms'], 1),
+            'Máx. (ms)': round(group['max_ms'], 1),
+            'Parseo medio (ms)': round(group['parse_ms'], 1),
+            'Filas': group['rows'],
+            'Errores': group['errors'],
+        }
+        for group in profiler.top_offenders()
+    ]
+    return html.Div([
+        html.H2("Rendimiento", style={'marginTop': '20px'}),
+        dbc.Table([html.Tbody([html.Tr([html.Th(name), html.Td(value)]) for name, value in summary])],
+                  bordered=True, style={'width': '100%'}),
+        html.H3("Consultas más costosas", style={'marginTop': '20px'}),
+        dash_table.DataTable(
+            data=offenders,
+            columns=[{'name': column, 'id': column} for column in (offenders[0] if offenders else ['Consulta'])],
+            sort_action='native',
+            style_cell={'textAlign': 'left', 'whiteSpace': 'normal', 'maxWidth': '600px'},
+        ) if offenders else html.P("Todavía no hay consultas lentas."),
+    ], style=styles)
+
 # Callback para cambiar el contenido de las pestañas
 @app.callback(
     Output("tab-content", "children"),
@@ -63,8 +260,11 @@ def render_tab_content(active_tab):
                 style={'width': '100%', 'height': '200px'}
             ),
             html.Button('Enviar consulta', id='submit-button', n_clicks=0, style={'marginTop': '10px'}),
+            dcc.Store(id='query-store'),
             html.Div(id='results-table-container', style={'marginTop': '20px', 'overflowX': 'auto'})
         ], style=styles)
+    elif active_tab == "performance":
+        return render_performance()
     elif active_tab == "about":
         return html.Div([
             html.H2("Sobre Nosotros", style={'marginTop': '20px'}),
@@ -76,30 +276,121 @@ def render_tab_content(active_tab):
         ], style=styles, className='py-3 rounded-md')
     return html.Div("Seleccione una pestaña.")
 
+def sort_rows(df, sort_by):
+    """Ordena las filas en el servidor según el `sort_by` de la DataTable"""
+    if not sort_by:
+        return df
+    columns = [sort['column_id'] for sort in sort_by]
+    ascending = [sort['direction'] == 'asc' for sort in sort_by]
+    try:
+        return df.sort_values(columns, ascending=ascending, na_position='last', kind='stable')
+    except TypeError:
+        # Tipos mezclados en una columna (p. ej. IRIs y fechas): se ordena por el texto
+        return df.sort_values(columns, ascending=ascending, na_position='last', kind='stable',
+                              key=lambda column: column.map(str, na_action='ignore'))
+
+def sorted_rows(active, sort_by):
+    """Filas del resultado activo en el orden pedido, reutilizando las ordenaciones previas"""
+    data = active['data'].iloc[:QUERY_MAX_ROWS]
+    if not sort_by:
+        return data
+    key = tuple((sort['column_id'], sort['direction']) for sort in sort_by)
+    order = active['orders'].get(key)
+    if order is None:
+        order = data.index.get_indexer(sort_rows(data, sort_by).index)
+        if len(active['orders']) >= SORT_ORDERS_PER_RESULT:
+            active['orders'].clear()
+        active['orders'][key] = order
+    return data.iloc[order]
+
+# Tipos que la DataTable recibe tal cual, el resto (duraciones, binarios,
+# decimales...) se muestra como texto
+JSON_TYPES = (str, int, float, bool, datetime.date)
+
+def json_cell(value):
+    if value is None or isinstance(value, JSON_TYPES):
+        return value
+    if isinstance(value, datetime.timedelta):
+        return duration_isoformat(value)  # xsd:duration, p. ej. P1DT2H
+    if isinstance(value, bytes):
+        return value.hex().upper()  # xsd:hexBinary / xsd:base64Binary
+    return str(value)
+
+def page_records(df):
+    """Filas de una página listas para la DataTable (sin NaN y serializables a JSON)"""
+    page = df.astype(object)
+    page = page.where(page.notna(), None)
+    return [{column: json_cell(value) for column, value in row.items()} for row in page.to_dict('records')]
+
 # Callback para enviar y ejecutar la consulta SPARQL
 @app.callback(
-    Output('results-table-container', 'children'),
+    [Output('results-table-container', 'children'),
+     Output('query-store', 'data')],
     [Input('submit-button', 'n_clicks')],
     [State('sparql-query', 'value')]
 )
 def update_table(n_clicks, sparql_query):
     if n_clicks > 0 and sparql_query:
-        data = query_rdf(g, sparql_query)
+        try:
+            active = active_result(sparql_query)
+        except QueryTimeout:
+            active = (f"La consulta ha superado el tiempo máximo de {QUERY_TIMEOUT:g} s y se ha cancelado. "
+                      "Añade filtros o un LIMIT para reducirla.")
         
-        if isinstance(data, str):
-            return html.Span(data, style={'color': '#ef4444', 'font-size': '18px', 'width': '100%'})
+        if isinstance(active, str):
+            return html.Span(active, style={'color': '#ef4444', 'font-size': '18px', 'width': '100%'}), None
 
-        if not data:
-            return html.Div("No hay resultados.")
+        data = active['data']
+        if data.empty:
+            return html.Div("No hay resultados."), None
         
-        # Convertir los resultados a un DataFrame
-        df = pd.DataFrame(data)
+        # Solo se envía al navegador la página visible, el resto se queda en el servidor
+        total = min(len(data), QUERY_MAX_ROWS)
+        info = f"{total} filas"
+        if len(data) > QUERY_MAX_ROWS:
+            info = f"Resultado truncado a las primeras {QUERY_MAX_ROWS} filas."
         
-        # Crear la tabla
-        return dbc.Table.from_dataframe(df, striped=True, bordered=True, hover=True, style={'width': '100%'})
-    return html.Div()
+        table = dash_table.DataTable(
+            id='results-table',
+            columns=[{'name': column, 'id': column} for column in data.columns],
+            page_current=0,
+            page_size=PAGE_SIZE,
+            page_count=-(-total // PAGE_SIZE),
+            page_action='custom',
+            sort_action='custom',
+            sort_mode='multi',
+            sort_by=[],
+            virtualization=True,
+            fixed_rows={'headers': True},
+            style_table={'height': '600px', 'overflowY': 'auto'},
+            style_cell={'textAlign': 'left', 'minWidth': '150px', 'whiteSpace': 'normal'},
+        )
+        return html.Div([html.Div(info, id='results-info', style={'marginBottom': '10px'}), table]), sparql_query
+    return html.Div(), None
+
+# Callback para paginar y ordenar los resultados en el servidor
+@app.callback(
+    Output('results-table', 'data'),
+    [Input('results-table', 'page_current'),
+     Input('results-table', 'page_size'),
+     Input('results-table', 'sort_by')],
+    [State('query-store', 'data')]
+)
+def update_page(page_current, page_size, sort_by, sparql_query):
+    if not sparql_query:
+        return []
+    try:
+        active = active_result(sparql_query)
+    except QueryTimeout:
+        return []
+    if isinstance(active, str):
+        return []
+
+    data = sorted_rows(active, sort_by)
+    start = page_current * page_size
+    return page_records(data.iloc[start:start + page_size])
 
-# Ejecutar la aplicación
+# Ejecutar la aplicación en modo desarrollo (en producción: gunicorn -c gunicorn.conf.py)
 if __name__ == '__main__':
     ssl._create_default_https_context = ssl._create_unverified_context
     app.run_server(debug=True, host='0.0.0.0', port=8050)
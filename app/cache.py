@@ -0,0 +1,116 @@
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+# Literals and IRIs are kept verbatim, comments and runs of whitespace are collapsed
+_TOKEN = re.compile(
+    r'"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\''
+    r'|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\''
+    r'|<[^<>"{}|^`\\\s]*>'
+    r'|(?P<comment>#[^\n]*)|(?P<space>\s+)'
+)
+
+
+def normalize_query(query):
+    """Canonical form of a SPARQL query, used as cache key
+
+    Args:
+        query (str): SPARQL query text.
+
+    Returns:
+        str: query without comments and with whitespace collapsed.
+    """
+    def replace(match):
+        if match.group('comment') is not None or match.group('space') is not None:
+            return ' '
+        return match.group(0)
+
+    return _TOKEN.sub(replace, query).strip()
+
+
+def estimate_size(rows):
+    """Rough size in bytes of a result (DataFrame or list of row tuples)"""
+    if hasattr(rows, 'memory_usage'):
+        return int(rows.memory_usage(index=True, deep=True).sum())
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return size
+
+
+class QueryCache:
+    """LRU cache of query results bounded by number of entries and memory
+
+    Entries belong to a graph version: as soon as a different version is used
+    (the graph was reloaded) every cached result is dropped.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=64 * 1024 * 1024, sizeof=estimate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, query, version):
+        """Returns the cached result of `query` or None"""
+        key = normalize_query(query)
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, query, version, value):
+        """Stores the result of `query` evaluated against graph `version`"""
+        key = normalize_query(query)
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
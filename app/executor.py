@@ -0,0 +1,77 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+
+class QueryTimeout(Exception):
+    """The query exceeded its time budget and was cancelled"""
+
+    def __init__(self, timeout):
+        super().__init__(f"query cancelled after {timeout:g} s")
+        self.timeout = timeout
+
+
+class CancelToken:
+    """Deadline and cancel flag of one running query"""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check(self):
+        if self._cancelled.is_set() or time.monotonic() > self.deadline:
+            raise QueryTimeout(self.timeout)
+
+
+_local = threading.local()
+
+
+def current_token():
+    """Token of the query running in this thread, None outside the pool"""
+    return getattr(_local, 'token', None)
+
+
+class QueryExecutor:
+    """Bounded thread pool running queries with a per-query timeout
+
+    Cancellation is cooperative: the graph checks `current_token()` while it
+    iterates triples, so a cancelled query stops at its next triple lookup
+    and releases its worker even if nobody waits for it anymore.
+    """
+
+    def __init__(self, max_workers=4, timeout=30.0):
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sparql")
+
+    @staticmethod
+    def _call(token, fn, args, kwargs):
+        _local.token = token
+        try:
+            token.check()  # it may have expired while waiting in the queue
+            return fn(*args, **kwargs)
+        finally:
+            _local.token = None
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        """Runs `fn(*args, **kwargs)` in the pool and waits for its result
+
+        Raises:
+            QueryTimeout: when it does not finish within `timeout` seconds.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        token = CancelToken(timeout)
+        future = self._pool.submit(self._call, token, fn, args, kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            token.cancel()
+            future.cancel()
+            raise QueryTimeout(timeout) from None
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
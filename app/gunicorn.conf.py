@@ -0,0 +1,53 @@
+# Configuración del modo producción: gunicorn -c gunicorn.conf.py
+#
+# El grafo se carga una sola vez en el proceso maestro (preload_app) y los
+# workers lo comparten copy-on-write tras el fork. `kill -HUP <maestro>`
+# recarga output.ttl en el maestro y sustituye los workers sin cortar
+# las peticiones en curso.
+#
+# Con un almacén en disco (GRAPH_STORE=BerkeleyDB) no hay precarga: sus
+# ficheros y bloqueos no se pueden heredar tras el fork, así que cada worker
+# abre el almacén al importar la app.
+import gc
+import multiprocessing
+import os
+
+# Los workers no recargan el grafo por su cuenta, perderían la memoria compartida
+os.environ.setdefault("GRAPH_AUTO_RELOAD", "0")
+
+wsgi_app = "app:server"
+bind = f"0.0.0.0:{os.environ.get('PORT', 8050)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 4))
+preload_app = os.environ.get("GRAPH_STORE", "Memory") == "Memory"
+timeout = int(os.environ.get("WEB_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+accesslog = "-"
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    import app
+
+    # Las vistas se construyen aquí una vez y los workers las comparten,
+    # en vez de construir cada uno su copia en su primera consulta
+    app.current_views()
+    # Los objetos ya cargados no se tocan en el GC de los workers, así sus
+    # páginas de memoria siguen compartidas con el maestro
+    gc.freeze()
+
+
+def on_reload(server):
+    if not server.cfg.preload_app:
+        # Los workers nuevos importan la app y cargan el grafo por su cuenta
+        return
+    import app
+
+    gc.unfreeze()
+    app.reload_graph(force=True)
+    app.current_views()
+    gc.collect()
+    gc.freeze()
+    server.log.info("Graph reloaded: %d triples", len(app.g))
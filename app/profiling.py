@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+from cache import normalize_query
+
+QueryProfile = namedtuple(
+    'QueryProfile',
+    ['started', 'source', 'query', 'parse_ms', 'eval_ms', 'rows', 'bytes', 'error']
+)
+
+
+class QueryProfiler:
+    """Collects per-query timings and keeps a ring buffer of the slow ones
+
+    Args:
+        slow_ms (float): queries taking at least this long (parse + eval)
+            go to the slow-query log.
+        capacity (int): size of the slow-query log and of the window used
+            for latency percentiles.
+    """
+
+    def __init__(self, slow_ms=500.0, capacity=200):
+        self.slow_ms = slow_ms
+        self.slow_log = deque(maxlen=capacity)
+        self._recent = deque(maxlen=capacity)  # total ms of the latest queries
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.slow_queries = 0
+        self.errors = 0
+        self.parse_ms = 0.0
+        self.eval_ms = 0.0
+        self.rows = 0
+        self.bytes = 0
+
+    def record(self, source, query, parse_ms, eval_ms, rows=0, size=0, error=None):
+        profile = QueryProfile(time.time(), source, query, parse_ms, eval_ms, rows, size, error)
+        total = parse_ms + eval_ms
+        with self._lock:
+            self.queries += 1
+            self.parse_ms += parse_ms
+            self.eval_ms += eval_ms
+            self.rows += rows
+            self.bytes += size
+            self._recent.append(total)
+            if error is not None:
+                self.errors += 1
+            if total >= self.slow_ms or error is not None:
+                self.slow_queries += 1
+                self.slow_log.append(profile)
+        return profile
+
+    def top_offenders(self, n=10):
+        """Slow-log entries grouped by query, sorted by accumulated time"""
+        with self._lock:
+            entries = list(self.slow_log)
+        groups = {}
+        for entry in entries:
+            key = normalize_query(entry.query)
+            group = groups.setdefault(key, {
+                "query": key, "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "parse_ms": 0.0, "rows": 0, "errors": 0, "last_seen": 0.0,
+            })
+            total = entry.parse_ms + entry.eval_ms
+            group["count"] += 1
+            group["total_ms"] += total
+            group["max_ms"] = max(group["max_ms"], total)
+            group["parse_ms"] += entry.parse_ms
+            group["rows"] = max(group["rows"], entry.rows)
+            group["errors"] += entry.error is not None
+            group["last_seen"] = max(group["last_seen"], entry.started)
+        for group in groups.values():
+            group["avg_ms"] = group["total_ms"] / group["count"]
+            group["parse_ms"] /= group["count"]
+        return sorted(groups.values(), key=lambda group: group["total_ms"], reverse=True)[:n]
+
+    def metrics(self):
+        with self._lock:
+            recent = sorted(self._recent)
+            metrics = {
+                "queries": self.queries,
+                "slow_queries": self.slow_queries,
+                "errors": self.errors,
+                "slow_threshold_ms": self.slow_ms,
+                "parse_ms_total": self.parse_ms,
+                "eval_ms_total": self.eval_ms,
+                "rows_total": self.rows,
+                "bytes_total": self.bytes,
+            }
+        for name, q in (("p50_ms", 0.50), ("p95_ms", 0.95), ("max_ms", 1.0)):
+            metrics[name] = recent[min(int(q * len(recent)), len(recent) - 1)] if recent else 0.0
+        return metrics
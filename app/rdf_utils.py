@@ -1,19 +1,255 @@
-from rdflib import Graph
+import os
+import pickle
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from hashlib import sha256
+from itertools import islice
+
+import pandas as pd
+from rdflib import Graph, Literal, URIRef
 from rdflib.plugins.sparql import prepareQuery
 
-def load_rdf(file_path):
-    g = Graph()
+from cache import normalize_query
+from executor import current_token
+
+# Bump when the snapshot layout changes so old snapshots are rebuilt
+SNAPSHOT_VERSION = 2
+GRAPH_STORE = os.environ.get("GRAPH_STORE", "Memory")
+# Context of the triples in a persistent store: it has to be the same when
+# the store is built and every time it is opened again
+STORE_GRAPH_ID = URIRef("urn:x-papers:graph")
+# Triples yielded between two checks of the query deadline
+CANCEL_CHECK_INTERVAL = 1024
+
+
+class QueryGraph(Graph):
+    """Graph whose triple lookups honour the cancel token of the running query"""
+
+    def triples(self, triple):
+        token = current_token()
+        if token is None:
+            yield from super().triples(triple)
+            return
+        token.check()
+        for i, t in enumerate(super().triples(triple), start=1):
+            if i % CANCEL_CHECK_INTERVAL == 0:
+                token.check()
+            yield t
+
+    def __reduce__(self):
+        # Graph.__reduce__ hardcodes Graph, keep the subclass in the snapshot
+        return (QueryGraph, (self.store, self.identifier))
+
+
+def source_fingerprint(file_path):
+    """Cheap fingerprint of the source file (no need to read it)
+
+    Args:
+        file_path (str): Path to the Turtle file.
+
+    Returns:
+        tuple: (version, store, size, mtime_ns) of the file.
+    """
+    stat = os.stat(file_path)
+    return (SNAPSHOT_VERSION, GRAPH_STORE, stat.st_size, stat.st_mtime_ns)
+
+
+def _parse_ttl(file_path, graph=None):
+    g = QueryGraph() if graph is None else graph
     g.parse(file_path, format="ttl")
     return g
 
-def query_rdf(g, query):
-    prepared_query = prepareQuery(query)
-    results = g.query(prepared_query)
-    columns = results.vars
-    results_list = []
-    for row in results:
-        result_dict = {}
-        for column in columns:
-            result_dict[str(column)] = str(row[column])
-        results_list.append(result_dict)
-    return results_list
+
+def _load_pickle_snapshot(file_path, snapshot_path):
+    fingerprint = source_fingerprint(file_path)
+    try:
+        with open(snapshot_path, 'rb') as f:
+            # The fingerprint is pickled first so a stale snapshot is discarded
+            # without unpickling the whole graph
+            if pickle.load(f) == fingerprint:
+                return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, IndexError, ValueError):
+        # Corrupt snapshot or written by another version of the code: rebuild it
+        pass
+
+    g = _parse_ttl(file_path)
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(fingerprint, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(g, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)  # atomic, several workers may race here
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return g
+
+
+def _load_disk_store(file_path, store_path):
+    # Every version of the source gets its own directory. It is built aside
+    # and renamed into place once complete, so a store is never half written
+    # nor mixed with the triples of a previous version.
+    fingerprint = repr(source_fingerprint(file_path))
+    version_path = os.path.join(store_path, sha256(fingerprint.encode("utf-8")).hexdigest()[:16])
+    if not os.path.isdir(version_path):
+        os.makedirs(store_path, exist_ok=True)
+        tmp_path = f"{version_path}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        g = QueryGraph(store=GRAPH_STORE, identifier=STORE_GRAPH_ID)
+        g.open(tmp_path, create=True)
+        try:
+            _parse_ttl(file_path, g)
+            g.commit()
+        finally:
+            g.close()
+        try:
+            os.rename(tmp_path, version_path)
+        except OSError:
+            # Another process built the same version first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    # Previous versions are no longer needed (builds in progress end in .tmp)
+    for name in os.listdir(store_path):
+        path = os.path.join(store_path, name)
+        if path != version_path and not name.endswith(".tmp"):
+            shutil.rmtree(path, ignore_errors=True)
+
+    g = QueryGraph(store=GRAPH_STORE, identifier=STORE_GRAPH_ID)
+    g.open(version_path, create=False)
+    return g
+
+
+def load_rdf(file_path, snapshot=True):
+    """Loads the knowledge graph, reusing a pre-built snapshot when possible
+
+    The snapshot is rebuilt only when `file_path` changes. With the default
+    `Memory` store the snapshot is a binary pickle of the parsed graph:
+    unpickling skips the Turtle parser but still rebuilds every triple, so
+    its cost grows linearly with the graph (several times faster than
+    parsing, not constant). Setting the `GRAPH_STORE` environment variable
+    to a persistent rdflib store (e.g. `BerkeleyDB`, which needs the
+    `berkeleydb` package and the Berkeley DB library) keeps the triples in
+    a directory next to `file_path` that is rebuilt when it changes. This
+    path is optional and not covered by the requirements of the app.
+
+    Args:
+        file_path (str): Path to the Turtle file.
+        snapshot (bool, optional): Use the snapshot. Defaults to True.
+
+    Returns:
+        Graph: the loaded graph.
+    """
+    if not snapshot:
+        return _parse_ttl(file_path)
+    if GRAPH_STORE == "Memory":
+        return _load_pickle_snapshot(file_path, f"{file_path}.snapshot")
+    return _load_disk_store(file_path, f"{file_path}.{GRAPH_STORE.lower()}")
+
+
+PREPARED_CACHE_ENTRIES = int(os.environ.get("PREPARED_CACHE_ENTRIES", 256))
+_prepared = OrderedDict()  # normalized query -> prepared query
+_prepared_lock = threading.Lock()
+
+
+def prepare_query(query):
+    """Parses a SPARQL query, reusing the algebra of previously seen queries
+
+    Queries that only differ in whitespace or comments share one entry, but
+    on a miss the text is parsed as written so error positions match it.
+    Parse errors are not cached, they raise `ParseBaseException` every time.
+
+    Args:
+        query (str): SPARQL query text.
+
+    Returns:
+        Query: prepared query, shared between calls and graphs.
+    """
+    key = normalize_query(query)
+    with _prepared_lock:
+        prepared = _prepared.get(key)
+        if prepared is not None:
+            _prepared.move_to_end(key)
+            return prepared
+    prepared = prepareQuery(query)
+    with _prepared_lock:
+        _prepared[key] = prepared
+        while len(_prepared) > PREPARED_CACHE_ENTRIES:
+            _prepared.popitem(last=False)
+    return prepared
+
+
+def to_native(term):
+    """Python value of a result term: numbers, dates and booleans for typed
+    literals, `URIRef` for IRIs and None for unbound variables"""
+    if term is None:
+        return None
+    return term.toPython()
+
+
+def _native_column(values):
+    return [None if value is None else value.toPython() for value in values]
+
+
+def rows_to_frame(variables, rows):
+    """DataFrame of rows given as tuples of terms in the order of `variables` (e.g. from the views)"""
+    names = [str(var) for var in variables]
+    return pd.DataFrame({name: [to_native(row[i]) for row in rows] for i, name in enumerate(names)}, columns=names)
+
+
+def query_rdf(g, query, initBindings=None, max_rows=None, timings=None, output="pandas"):
+    """Runs a SPARQL query against the graph
+
+    The result is converted column by column, typed literals keep their
+    Python type (float, date, ...) instead of being turned into strings.
+
+    Args:
+        g (Graph): Graph to query.
+        query (str): SPARQL query text, parsed once and then reused.
+        initBindings (dict, optional): Values for the query variables, so
+            parameterized queries share the same parsed algebra.
+        max_rows (int, optional): Stop reading results after this many rows.
+        timings (dict, optional): Filled with `parse_ms` and `eval_ms`.
+        output (str, optional): "pandas" (DataFrame), "arrow" (pyarrow.Table)
+            or "columns" (dict of lists). Defaults to "pandas".
+
+    Returns:
+        DataFrame | pyarrow.Table | dict: one column per variable.
+    """
+    started = time.perf_counter()
+    prepared_query = prepare_query(query)
+    parsed = time.perf_counter()
+    if timings is not None:
+        timings['parse_ms'] = (parsed - started) * 1000
+    results = g.query(prepared_query, initBindings=initBindings)
+    if results.type == "ASK":
+        names, rows = ["ask"], [(Literal(results.askAnswer),)]
+    elif results.type == "SELECT":
+        names, rows = [str(var) for var in results.vars], list(islice(results, max_rows))
+    else:  # CONSTRUCT / DESCRIBE
+        names, rows = ["subject", "predicate", "object"], list(islice(results, max_rows))
+    # Transpose once and convert each column, no dict per row
+    values = zip(*rows) if rows else [[] for _ in names]
+    columns = {name: _native_column(column) for name, column in zip(names, values)}
+    if timings is not None:
+        timings['eval_ms'] = (time.perf_counter() - parsed) * 1000
+
+    if output == "columns":
+        return columns
+    if output == "arrow":
+        return _arrow_table(columns)
+    return pd.DataFrame(columns, columns=names)
+
+
+def _arrow_table(columns):
+    import pyarrow as pa  # optional, only needed for Arrow output
+
+    arrays = {}
+    for name, column in columns.items():
+        try:
+            arrays[name] = pa.array(column)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed types in one variable (e.g. IRIs and dates): keep the text
+            arrays[name] = pa.array([None if value is None else str(value) for value in column])
+    return pa.table(arrays)
@@ -0,0 +1,243 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from flask import Blueprint, Response, request
+from pyparsing.exceptions import ParseBaseException
+from rdflib import BNode, Graph, URIRef
+
+from cache import estimate_size
+from executor import QueryTimeout
+from rdf_utils import prepare_query
+
+# Rows serialized per chunk written to the response
+CHUNK_ROWS = 500
+
+SELECT_FORMATS = {
+    "application/sparql-results+json": "json",
+    "application/json": "json",
+    "text/csv": "csv",
+    "text/tab-separated-values": "tsv",
+}
+GRAPH_FORMATS = {
+    "text/turtle": "turtle",
+    "application/n-triples": "nt",
+}
+FORMAT_ALIASES = {"json": "application/sparql-results+json", "csv": "text/csv", "tsv": "text/tab-separated-values",
+                  "turtle": "text/turtle", "ttl": "text/turtle", "nt": "application/n-triples"}
+
+
+def json_term(term):
+    """Term in the SPARQL 1.1 Query Results JSON format"""
+    if isinstance(term, URIRef):
+        return {"type": "uri", "value": str(term)}
+    if isinstance(term, BNode):
+        return {"type": "bnode", "value": str(term)}
+    value = {"type": "literal", "value": str(term)}
+    if term.language:
+        value["xml:lang"] = term.language
+    elif term.datatype:
+        value["datatype"] = str(term.datatype)
+    return value
+
+
+def json_chunks(variables, rows):
+    names = [str(var) for var in variables]
+    yield '{"head": {"vars": %s}, "results": {"bindings": [' % json.dumps(names)
+    first = True
+    while True:
+        chunk = list(islice(rows, CHUNK_ROWS))
+        if not chunk:
+            break
+        text = ",\n".join(
+            json.dumps({name: json_term(term) for name, term in zip(names, row) if term is not None})
+            for row in chunk
+        )
+        yield text if first else ",\n" + text
+        first = False
+    yield "]}}\n"
+
+
+def delimited_chunks(variables, rows, tsv):
+    names = [str(var) for var in variables]
+    buffer = io.StringIO()
+    if tsv:
+        # TSV results use the N-Triples form of each term
+        buffer.write("\t".join(f"?{name}" for name in names) + "\n")
+    else:
+        writer = csv.writer(buffer, lineterminator="\r\n")
+        writer.writerow(names)
+    yield buffer.getvalue()
+    while True:
+        chunk = list(islice(rows, CHUNK_ROWS))
+        if not chunk:
+            break
+        buffer = io.StringIO()
+        if tsv:
+            for row in chunk:
+                buffer.write("\t".join(term.n3() if term is not None else "" for term in row) + "\n")
+        else:
+            writer = csv.writer(buffer, lineterminator="\r\n")
+            writer.writerows([str(term) if term is not None else "" for term in row] for row in chunk)
+        yield buffer.getvalue()
+
+
+def cached_size(value):
+    """Size of a cached `(vars, rows)` result"""
+    return estimate_size(value[1])
+
+
+def negotiate(formats):
+    """Chooses the response media type from `format` or the Accept header"""
+    requested = request.args.get("format") or request.form.get("format")
+    if requested:
+        media_type = FORMAT_ALIASES.get(requested, requested)
+        return media_type if media_type in formats else None
+    return request.accept_mimetypes.best_match(list(formats), default=next(iter(formats)))
+
+
+def sparql_blueprint(get_graph, executor, cache, max_rows, profiler=None, router=None):
+    """SPARQL 1.1 Protocol endpoint sharing the graph, cache and pool of the UI
+
+    Args:
+        get_graph (callable): returns the current `(graph, version)`.
+        executor (QueryExecutor): pool running the queries (and their timeouts).
+        cache (QueryCache): cache of SELECT results, stored as rdflib terms.
+        max_rows (int): maximum number of rows of a SELECT result, or of
+            triples of a CONSTRUCT/DESCRIBE result. Longer results are cut
+            and flagged with the `X-Result-Truncated` header.
+        profiler (QueryProfiler, optional): records the timings of each query.
+        router (callable, optional): returns `(vars, rows)` for the queries
+            that can be answered without evaluating them, None otherwise.
+            Rows are tuples of terms in the order of `vars`.
+
+    Returns:
+        Blueprint: blueprint serving `/sparql`.
+    """
+    blueprint = Blueprint("sparql", __name__)
+
+    def select_rows(graph, prepared):
+        # One row past the cap tells whether the result was truncated. The
+        # rows are kept as rdflib returns them, tuples in the order of vars
+        result = graph.query(prepared)
+        return result.vars, list(islice(result, max_rows + 1))
+
+    def graph_body(graph, prepared, rdf_format):
+        result = Graph(namespace_manager=graph.namespace_manager)
+        triples = list(islice(graph.query(prepared), max_rows + 1))
+        for triple in triples[:max_rows]:
+            result.add(triple)
+        return result.serialize(format=rdf_format), len(triples) > max_rows
+
+    def error(message, status):
+        return Response(message + "\n", status=status, mimetype="text/plain")
+
+    def record(query, parse_ms, eval_ms, rows=0, size=0, error=None):
+        if profiler is not None:
+            profiler.record("sparql", query, parse_ms, eval_ms, rows, size, error)
+
+    def elapsed_ms(started):
+        return (time.perf_counter() - started) * 1000
+
+    def measured(query, parse_ms, eval_ms, rows, chunks):
+        # Bytes are counted while sending, the time is the evaluation only
+        size = 0
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+        record(query, parse_ms, eval_ms, rows, size)
+
+    @blueprint.route("/sparql", methods=["GET", "POST"])
+    def sparql():
+        if request.method == "POST" and request.mimetype == "application/sparql-query":
+            query = request.get_data(as_text=True)
+        else:
+            query = request.values.get("query")
+        if not query:
+            return error("Missing 'query' parameter", 400)
+        if request.values.getlist("default-graph-uri") or request.values.getlist("named-graph-uri"):
+            return error("Dataset parameters are not supported, the endpoint serves a single graph", 400)
+
+        started = time.perf_counter()
+        try:
+            prepared = prepare_query(query)
+        except ParseBaseException as err:
+            record(query, elapsed_ms(started), 0.0, error="parse error")
+            return error(err.explain(), 400)
+        except Exception as err:
+            # rdflib raises a plain Exception for unknown prefixes
+            record(query, elapsed_ms(started), 0.0, error="parse error")
+            return error(f"Invalid query: {err}", 400)
+        parse_ms = elapsed_ms(started)
+        started = time.perf_counter()
+
+        graph, version = get_graph()
+        kind = prepared.algebra.name
+
+        if kind in ("ConstructQuery", "DescribeQuery"):
+            media_type = negotiate(GRAPH_FORMATS)
+            if media_type is None:
+                return error("Not acceptable", 406)
+            try:
+                body, truncated = executor.run(graph_body, graph, prepared, GRAPH_FORMATS[media_type])
+            except QueryTimeout as err:
+                record(query, parse_ms, elapsed_ms(started), error="timeout")
+                return error(str(err), 503)
+            except Exception as err:
+                record(query, parse_ms, elapsed_ms(started), error=type(err).__name__)
+                return error(f"Query evaluation failed: {err}", 500)
+            record(query, parse_ms, elapsed_ms(started), size=len(body))
+            headers = {"X-Result-Truncated": str(max_rows)} if truncated else {}
+            return Response(body, mimetype=media_type, headers=headers)
+
+        if kind == "AskQuery":
+            try:
+                answer = executor.run(lambda: graph.query(prepared).askAnswer)
+            except QueryTimeout as err:
+                record(query, parse_ms, elapsed_ms(started), error="timeout")
+                return error(str(err), 503)
+            except Exception as err:
+                record(query, parse_ms, elapsed_ms(started), error=type(err).__name__)
+                return error(f"Query evaluation failed: {err}", 500)
+            record(query, parse_ms, elapsed_ms(started), rows=1)
+            return Response(json.dumps({"head": {}, "boolean": answer}) + "\n",
+                            mimetype="application/sparql-results+json")
+
+        media_type = negotiate(SELECT_FORMATS)
+        if media_type is None:
+            return error("Not acceptable", 406)
+        output = SELECT_FORMATS[media_type]
+
+        routed = router(query) if router is not None else None
+        cached = routed or cache.get(query, version)
+        if cached is not None:
+            variables, rows = cached
+        else:
+            # The whole result is evaluated before the first byte is sent, so
+            # errors and timeouts get a status code instead of a cut body, and
+            # a slow client does not hold a worker of the pool
+            try:
+                variables, rows = executor.run(select_rows, graph, prepared)
+            except QueryTimeout as err:
+                record(query, parse_ms, elapsed_ms(started), error="timeout")
+                return error(str(err), 503)
+            except Exception as err:
+                record(query, parse_ms, elapsed_ms(started), error=type(err).__name__)
+                return error(f"Query evaluation failed: {err}", 500)
+            cache.put(query, version, (variables, rows))
+        eval_ms = elapsed_ms(started)
+
+        headers = {}
+        if len(rows) > max_rows:
+            rows = rows[:max_rows]
+            headers["X-Result-Truncated"] = str(max_rows)
+        if output == "json":
+            chunks = json_chunks(variables, iter(rows))
+        else:
+            chunks = delimited_chunks(variables, iter(rows), tsv=output == "tsv")
+        return Response(measured(query, parse_ms, eval_ms, len(rows), chunks), mimetype=media_type,
+                        headers=headers)
+
+    return blueprint
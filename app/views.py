@@ -0,0 +1,285 @@
+import re
+from collections import defaultdict
+
+from flask import Blueprint, request
+from rdflib import Namespace, RDF, URIRef
+from rdflib.plugins.sparql import prepareQuery
+
+from cache import normalize_query
+
+ONTO = Namespace("http://upm.ontology.es/papers#")
+BASE = "https://papers.knowledgegraph.org/v1/"
+
+# Canonical queries answered from the views. Any query equal to one of these
+# (up to whitespace and comments) with another IRI in place of the
+# placeholder is routed to the matching lookup instead of being evaluated.
+SIMILAR_QUERY = """
+PREFIX onto: <http://upm.ontology.es/papers#>
+SELECT ?paper ?score WHERE {
+  <PAPER> onto:hasSimilarity ?similarity .
+  ?similarity onto:isSimilarTo ?paper ;
+              onto:score ?score .
+} ORDER BY DESC(?score)
+"""
+
+TOPIC_QUERY = """
+PREFIX onto: <http://upm.ontology.es/papers#>
+SELECT ?paper ?score WHERE {
+  ?paper onto:hasTopic ?assign .
+  ?assign onto:assign <TOPIC> ;
+          onto:score ?score .
+} ORDER BY DESC(?score)
+"""
+
+COAUTHORS_QUERY = """
+PREFIX onto: <http://upm.ontology.es/papers#>
+SELECT DISTINCT ?coauthor WHERE {
+  ?paper onto:hasAuthor <AUTHOR> , ?coauthor .
+  ?coauthor a onto:Person .
+  FILTER(?coauthor != <AUTHOR>)
+} ORDER BY ?coauthor
+"""
+
+INSTITUTIONS_QUERY = """
+PREFIX onto: <http://upm.ontology.es/papers#>
+SELECT ?institution WHERE {
+  <AUTHOR> onto:isMemberOf ?institution .
+} ORDER BY ?institution
+"""
+
+
+def _template_pattern(template, placeholder):
+    text = re.escape(normalize_query(template))
+    # The first placeholder captures the IRI, the rest must repeat it
+    text = text.replace(f"<{placeholder}>", "<(?P<iri>[^<>\\s]+)>", 1)
+    text = text.replace(f"<{placeholder}>", "<(?P=iri)>")
+    return re.compile(text + "$")
+
+
+# (pattern, variables, lookup of MaterializedViews) of each canonical query,
+# compiled once so a query can be matched before the views exist
+_ROUTES = [
+    (_template_pattern(SIMILAR_QUERY, "PAPER"), ["paper", "score"], "similar"),
+    (_template_pattern(TOPIC_QUERY, "TOPIC"), ["paper", "score"], "topic_papers"),
+    (_template_pattern(COAUTHORS_QUERY, "AUTHOR"), ["coauthor"], "_coauthor_rows"),
+    (_template_pattern(INSTITUTIONS_QUERY, "AUTHOR"), ["institution"], "author_institutions"),
+]
+
+
+def match_route(query):
+    """Finds the canonical query `query` is an instance of
+
+    Only the query text is looked at, the views are not needed.
+
+    Returns:
+        tuple: (variables, lookup, iri) to pass to `MaterializedViews.answer`,
+        or None when the query has to be evaluated by rdflib.
+    """
+    text = normalize_query(query)
+    for pattern, variables, lookup in _ROUTES:
+        match = pattern.match(text)
+        if match is not None:
+            return variables, lookup, URIRef(match.group("iri"))
+    return None
+
+
+def _score(term):
+    return float(term.toPython())
+
+
+class MaterializedViews:
+    """Adjacency indexes for the most frequent lookups of the graph
+
+    Built once per graph load; every lookup is a dictionary access.
+
+    Args:
+        graph (Graph): knowledge graph generated from the mappings.
+    """
+
+    def __init__(self, graph):
+        self.similar = defaultdict(list)          # paper -> [(paper, score)]
+        self.topic_papers = defaultdict(list)     # topic -> [(paper, score)]
+        self.paper_topics = defaultdict(list)     # paper -> [(topic, score)]
+        self.paper_authors = defaultdict(list)    # paper -> [author], people only
+        self.author_papers = defaultdict(list)    # author or institution -> [paper]
+        self.author_institutions = defaultdict(list)  # author -> [institution]
+
+        people = set(graph.subjects(RDF.type, ONTO.Person))
+
+        for paper, similarity in graph.subject_objects(ONTO.hasSimilarity):
+            for other in graph.objects(similarity, ONTO.isSimilarTo):
+                for score in graph.objects(similarity, ONTO.score):
+                    self.similar[paper].append((other, score))
+
+        for paper, assign in graph.subject_objects(ONTO.hasTopic):
+            for topic in graph.objects(assign, ONTO.assign):
+                for score in graph.objects(assign, ONTO.score):
+                    self.topic_papers[topic].append((paper, score))
+                    self.paper_topics[paper].append((topic, score))
+
+        for paper, author in graph.subject_objects(ONTO.hasAuthor):
+            # hasAuthor also links the institutions of the paper: they have
+            # co-authors too, but are never co-authors themselves
+            self.author_papers[author].append(paper)
+            if author in people:
+                self.paper_authors[paper].append(author)
+
+        for author, institution in graph.subject_objects(ONTO.isMemberOf):
+            self.author_institutions[author].append(institution)
+
+        for index in (self.similar, self.topic_papers, self.paper_topics):
+            for values in index.values():
+                values.sort(key=lambda value: _score(value[1]), reverse=True)
+        for index in (self.paper_authors, self.author_papers, self.author_institutions):
+            for values in index.values():
+                values.sort()
+
+    def similar_papers(self, paper, limit=None):
+        """Papers similar to `paper`, most similar first, as (paper, score)"""
+        return self.similar.get(paper, [])[:limit]
+
+    def papers_in_topic(self, topic, limit=None):
+        """Papers assigned to `topic`, highest probability first, as (paper, score)"""
+        return self.topic_papers.get(topic, [])[:limit]
+
+    def topics_of(self, paper):
+        return self.paper_topics.get(paper, [])
+
+    def coauthors(self, author):
+        """Co-authors (people) of `author` with the number of papers they share
+
+        `author` may also be an institution linked to papers by `hasAuthor`,
+        as in `COAUTHORS_QUERY`.
+        """
+        shared = defaultdict(int)
+        for paper in self.author_papers.get(author, []):
+            for other in self.paper_authors[paper]:
+                if other != author:
+                    shared[other] += 1
+        return sorted(shared.items(), key=lambda item: (-item[1], item[0]))
+
+    def institutions(self, author):
+        return self.author_institutions.get(author, [])
+
+    def _coauthor_rows(self, author):
+        return sorted(other for other, _ in self.coauthors(author))
+
+    def route(self, query):
+        """Answers `query` from the views when it is one of the canonical queries
+
+        Returns:
+            tuple: (variables, rows) with rows as tuples of rdflib terms in
+            the order of the variables, or None when the query has to be
+            evaluated by rdflib.
+        """
+        route = match_route(query)
+        return None if route is None else self.answer(route)
+
+    def answer(self, route):
+        """Rows of a route found by `match_route`, as `(variables, rows)`"""
+        variables, lookup, iri = route
+        index = getattr(self, lookup)
+        values = index(iri) if callable(index) else index.get(iri, [])
+        if len(variables) == 1:
+            return variables, [(value,) for value in values]
+        return variables, [tuple(value) for value in values]
+
+
+def check_routes(graph, views=None):
+    """Compares the routed answers with rdflib for every IRI of the graph
+
+    Each canonical query is evaluated with every IRI of `graph` in place of
+    its placeholder. Rows are compared as sets and, for the queries sorted
+    by score, the routed rows must also be sorted by score.
+
+    Args:
+        graph (Graph): knowledge graph.
+        views (MaterializedViews, optional): views to check, built from
+            `graph` when not given.
+
+    Returns:
+        list[str]: description of each query whose answers differ.
+    """
+    views = MaterializedViews(graph) if views is None else views
+    iris = sorted({term for triple in graph for term in triple if isinstance(term, URIRef)})
+    templates = [(SIMILAR_QUERY, "PAPER"), (TOPIC_QUERY, "TOPIC"),
+                 (COAUTHORS_QUERY, "AUTHOR"), (INSTITUTIONS_QUERY, "AUTHOR")]
+    mismatches = []
+    for template, placeholder in templates:
+        prepared = prepareQuery(template.replace(f"<{placeholder}>", "?__iri"))
+        for iri in iris:
+            query = template.replace(f"<{placeholder}>", f"<{iri}>")
+            variables, routed = views.route(query)
+            result = graph.query(prepared, initBindings={"__iri": iri})
+            expected = [tuple(row[var] for var in variables) for row in result]
+            got = list(routed)
+            scores = [_score(row[1]) for row in got] if variables[-1] == "score" else []
+            if sorted(got) != sorted(expected) or scores != sorted(scores, reverse=True):
+                mismatches.append(f"{placeholder} <{iri}>: {len(got)} routed rows, {len(expected)} from rdflib")
+    return mismatches
+
+
+def paper_uri(paper_id):
+    return URIRef(f"{BASE}paper/{paper_id}")
+
+
+def topic_uri(topic_id):
+    return URIRef(f"{BASE}topic/{topic_id}")
+
+
+def author_uri(author_id):
+    return URIRef(f"{BASE}author/{author_id}")
+
+
+def views_blueprint(get_views):
+    """JSON API over the materialized views
+
+    Args:
+        get_views (callable): returns the views of the current graph.
+
+    Returns:
+        Blueprint: blueprint serving the `/api/...` lookups.
+    """
+    blueprint = Blueprint("views", __name__, url_prefix="/api")
+
+    def limit():
+        return request.args.get("limit", type=int)
+
+    @blueprint.route("/papers/<paper_id>/similar")
+    def similar(paper_id):
+        return [{"paper": str(paper), "score": _score(score)}
+                for paper, score in get_views().similar_papers(paper_uri(paper_id), limit())]
+
+    @blueprint.route("/papers/<paper_id>/topics")
+    def topics(paper_id):
+        return [{"topic": str(topic), "score": _score(score)}
+                for topic, score in get_views().topics_of(paper_uri(paper_id))]
+
+    @blueprint.route("/topics/<topic_id>/papers")
+    def topic_papers(topic_id):
+        return [{"paper": str(paper), "score": _score(score)}
+                for paper, score in get_views().papers_in_topic(topic_uri(topic_id), limit())]
+
+    @blueprint.route("/authors/<author_id>/coauthors")
+    def coauthors(author_id):
+        return [{"author": str(author), "shared_papers": shared}
+                for author, shared in get_views().coauthors(author_uri(author_id))[:limit()]]
+
+    @blueprint.route("/authors/<author_id>/institutions")
+    def institutions(author_id):
+        return [str(institution) for institution in get_views().institutions(author_uri(author_id))]
+
+    return blueprint
+
+
+if __name__ == "__main__":
+    # python views.py [output.ttl]: checks the routed queries against rdflib
+    import sys
+
+    from rdf_utils import load_rdf
+
+    mismatches = check_routes(load_rdf(sys.argv[1] if len(sys.argv) > 1 else "output.ttl"))
+    for mismatch in mismatches:
+        print(mismatch)
+    print(f"{len(mismatches)} mismatches")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,332 @@
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "code"), os.path.join(ROOT, "app")]
+
+from pipeline import Stage, run_stage  # noqa: E402
+from synthetic import CITIES, FIRST_NAMES, generate_corpus  # noqa: E402
+
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+BASELINE_FILE = os.path.join(BENCH_DIR, "baseline.json")
+LAST_RUN_FILE = os.path.join(BENCH_DIR, "last_run.json")
+
+SIZES = [1000, 10000, 100000]
+STAGES = ["similarity", "topic", "acknowledgment", "rdf", "sparql"]
+# Dimension of the sentence-transformers/all-MiniLM-L6-v2 embeddings
+EMBEDDING_DIM = 384
+_WORD = re.compile(r"[a-z]+")
+
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)] * 1000 if values else 0.0
+
+
+# Stages. Each one runs the code of the repository on the corpus in `corpus`
+# and returns the number of items processed plus extra metrics; the models
+# are replaced by local stubs so the benchmark runs offline.
+
+def hashed_embedding(text):
+    """Stub of the sentence encoder: L2-normalized hashed bag of words,
+    with the same shape as the embeddings of `similarity.get_embeddings`"""
+    import numpy as np
+
+    vector = np.zeros((1, EMBEDDING_DIM), dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        vector[0, zlib.crc32(word.encode()) % EMBEDDING_DIM] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def bench_similarity(corpus):
+    import similarity
+
+    papers = similarity.get_abstracts(os.path.join(corpus, "results.json"))
+    start = time.perf_counter()
+    embeddings = [hashed_embedding(paper["abstract"]) for paper in papers]
+    embedded = time.perf_counter()
+    # Same threshold as similarity.main
+    pairs = similarity.get_similar_papers(embeddings, thress=.0001)
+    return len(papers), {"embed_s": embedded - start, "pairs": len(pairs)}
+
+
+def bench_topic(corpus):
+    import topic
+    from gensim import corpora
+
+    abstracts = topic.load_abstracts(os.path.join(corpus, "results.json"))
+    # Plain tokenizer instead of NLTK (its data has to be downloaded) and the
+    # number of topics of the corpus instead of the coherence search
+    tokens = [_WORD.findall(abstract.lower()) for abstract in abstracts]
+    dictionary = corpora.Dictionary(tokens)
+    dictionary.filter_extremes(no_below=5, no_above=0.5)
+    bow = [dictionary.doc2bow(doc) for doc in tokens]
+    num_topics = len(load_json(os.path.join(corpus, "topics.json")))
+    lda_model = topic.train_lda_model(bow, dictionary, num_topics)
+    document_topics = topic.get_document_topics(lda_model, bow)
+    return len(document_topics), {"vocabulary": len(dictionary), "topics": num_topics}
+
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_PEOPLE = set(FIRST_NAMES)
+_PLACES = set(CITIES)
+_SENTENCE_START = {"We", "This", "The"}
+
+
+def stub_ner(text):
+    """Stub of the NER pipeline: runs of capitalized words are entities
+
+    Output has the format of the `transformers` token classification
+    pipeline (entity, score, index, word, start, end), which is what
+    `acknowledgment.filtrar_entidades_por_score_y_etiquetas` consumes.
+    """
+    entities, label = [], None
+    for index, match in enumerate(_TOKEN.finditer(text), start=1):
+        word = match.group(0)
+        if word[:1].isupper() and word not in _SENTENCE_START:
+            if label is None:
+                label = "PER" if word in _PEOPLE else "LOC" if word in _PLACES else "ORG"
+                tag = f"B-{label}"
+            else:
+                tag = f"I-{label}"
+        elif label is not None and word in ("of", "."):
+            tag = f"I-{label}"  # "University of X", "Ana B. Garcia"
+        else:
+            label = None
+            continue
+        entities.append({"entity": tag, "score": 0.99, "index": index, "word": word,
+                         "start": match.start(), "end": match.end()})
+    return entities
+
+
+def bench_acknowledgment(corpus):
+    import acknowledgment
+
+    papers = acknowledgment.load_results(os.path.join(corpus, "results.json"))
+    entities = 0
+    for paper in papers:
+        text = paper["acknowledgment"]
+        found = acknowledgment.filtrar_entidades_por_score_y_etiquetas(stub_ner(text), 0.90, text, paper["id"])
+        entities += sum(len(found[label]) for label in ("PER", "ORG", "LOC", "MISC"))
+    return len(papers), {"entities": entities}
+
+
+def bench_rdf(corpus):
+    import rdf_generator
+
+    stats = rdf_generator.generate(corpus, os.path.join(corpus, "output.ttl"))
+    return stats["triples"], {"subjects": stats["subjects"]}
+
+
+def bench_sparql(corpus, repeat=20):
+    from rdf_utils import load_rdf, query_rdf
+    from views import (COAUTHORS_QUERY, INSTITUTIONS_QUERY, SIMILAR_QUERY, TOPIC_QUERY,
+                       MaterializedViews, author_uri, paper_uri, topic_uri)
+
+    output = os.path.join(corpus, "output.ttl")
+    if not os.path.exists(output):
+        bench_rdf(corpus)
+    start = time.perf_counter()
+    graph = load_rdf(output, snapshot=False)
+    loaded = time.perf_counter()
+    views = MaterializedViews(graph)
+    indexed = time.perf_counter()
+
+    rng = random.Random(0)
+    papers = load_json(os.path.join(corpus, "papers_info.json"))
+    n_topics = len(load_json(os.path.join(corpus, "topics.json")))
+    templates = {
+        "similar": (SIMILAR_QUERY, "PAPER", lambda: paper_uri(rng.choice(papers)["id"])),
+        "topic": (TOPIC_QUERY, "TOPIC", lambda: topic_uri(rng.randrange(n_topics))),
+        "coauthors": (COAUTHORS_QUERY, "AUTHOR", lambda: author_uri(rng.choice(rng.choice(papers)["authors"]))),
+        "institutions": (INSTITUTIONS_QUERY, "AUTHOR", lambda: author_uri(rng.choice(rng.choice(papers)["authors"]))),
+    }
+    latencies, view_latencies = {}, []
+    for name, (template, placeholder, pick) in templates.items():
+        latencies[name] = []
+        for _ in range(repeat):
+            query = template.replace(f"<{placeholder}>", f"<{pick()}>")
+            started = time.perf_counter()
+            query_rdf(graph, query)
+            latencies[name].append(time.perf_counter() - started)
+            started = time.perf_counter()
+            views.route(query)
+            view_latencies.append(time.perf_counter() - started)
+
+    every = [value for values in latencies.values() for value in values]
+    metrics = {
+        "triples": len(graph),
+        "load_s": loaded - start,
+        "views_build_s": indexed - loaded,
+        "p50_ms": percentile(every, 0.50),
+        "p95_ms": percentile(every, 0.95),
+        "views_p95_ms": percentile(view_latencies, 0.95),
+        # Throughput of the queries alone, without loading the graph
+        "seconds": sum(every),
+    }
+    for name, values in latencies.items():
+        metrics[f"{name}_p50_ms"] = percentile(values, 0.50)
+    return len(every), metrics
+
+
+BENCHMARKS = {
+    "similarity": bench_similarity,
+    "topic": bench_topic,
+    "acknowledgment": bench_acknowledgment,
+    "rdf": bench_rdf,
+    "sparql": bench_sparql,
+}
+
+
+def run_child(stage, corpus, output):
+    """Runs one stage in this process and writes its metrics to `output`"""
+    try:
+        start = time.perf_counter()
+        items, metrics = BENCHMARKS[stage](corpus)
+        stage_s = time.perf_counter() - start
+        # A stage may report the time of its measured part only
+        seconds = metrics.pop("seconds", stage_s)
+        result = {"status": "ok", "items": items, "seconds": seconds, "stage_s": stage_s,
+                  "throughput": items / seconds if seconds else 0.0, **metrics}
+    except ImportError as err:
+        result = {"status": "skipped", "reason": f"missing dependency: {err.name}"}
+    except MemoryError:
+        result = {"status": "failed", "reason": "out of memory"}
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f)
+
+
+def corpus_dir(size, seed=0):
+    path = os.path.join(DATA_DIR, f"{size}-{seed}")
+    if not os.path.exists(os.path.join(path, "results.json")):
+        print(f"Generating corpus of {size} papers in {path}")
+        generate_corpus(size, path, seed)
+    return path
+
+
+def run_benchmarks(sizes=SIZES, stages=STAGES, timeout=900, seed=0):
+    """Runs every stage on every corpus size, each one in its own process
+
+    A separate process per stage isolates its peak RSS. A stage that
+    exceeds `timeout` seconds is killed and reported as "timeout".
+
+    Returns:
+        dict: "<size>/<stage>" -> metrics of the stage.
+    """
+    results = {}
+    log_dir = os.path.join(BENCH_DIR, "logs")
+    for size in sizes:
+        corpus = corpus_dir(size, seed)
+        for stage in stages:
+            output = os.path.join(corpus, f"{stage}.metrics.json")
+            if os.path.exists(output):
+                os.remove(output)
+            print(f"[{size}/{stage}] running")
+            child = Stage(f"{size}-{stage}", os.path.abspath(__file__),
+                          ["--child", stage, "--corpus", corpus, "--metrics", output], [], [], [])
+            code, wall_s, peak_mb = run_stage(child, log_dir, timeout)
+            if os.path.exists(output):
+                result = load_json(output)
+            elif code < 0 and wall_s >= timeout:
+                result = {"status": "timeout"}
+            else:
+                result = {"status": "failed", "reason": f"exit code {code}, see {log_dir}/{child.name}.log"}
+            result.update(wall_s=wall_s, peak_mb=peak_mb)
+            results[f"{size}/{stage}"] = result
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """Regressions of `results` against `baseline`
+
+    A regression is a stage that stopped finishing, whose throughput
+    dropped or whose peak RSS grew by more than `tolerance`.
+
+    Returns:
+        list[str]: description of each regression.
+    """
+    regressions = []
+    for key, base in baseline.items():
+        current = results.get(key)
+        if current is None or base.get("status") != "ok":
+            continue
+        if current["status"] != "ok":
+            regressions.append(f"{key}: {current['status']} (was ok)")
+            continue
+        if current["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {current['throughput']:.1f}/s (baseline {base['throughput']:.1f}/s)")
+        if current.get("peak_mb") and base.get("peak_mb") and current["peak_mb"] > base["peak_mb"] * (1 + tolerance):
+            regressions.append(f"{key}: peak RSS {current['peak_mb']:.0f} MB (baseline {base['peak_mb']:.0f} MB)")
+    return regressions
+
+
+def print_report(results, baseline):
+    print(f"{'benchmark':<22} {'status':<8} {'items':>9} {'time (s)':>9} {'items/s':>10} "
+          f"{'p95 (ms)':>9} {'peak (MB)':>10} {'vs base':>8}")
+    for key, result in results.items():
+        base = baseline.get(key, {})
+        ok = result["status"] == "ok"
+        delta = "-"
+        if ok and base.get("status") == "ok" and base.get("throughput"):
+            delta = f"{result['throughput'] / base['throughput'] - 1:+.0%}"
+        peak = "-" if result.get("peak_mb") is None else f"{result['peak_mb']:.0f}"
+        print(f"{key:<22} {result['status']:<8} "
+              + (f"{result['items']:>9} {result['seconds']:>9.2f} {result['throughput']:>10.1f} "
+                 + (f"{result['p95_ms']:>9.2f} " if "p95_ms" in result else f"{'-':>9} ")
+                 if ok else f"{'-':>9} {result['wall_s']:>9.2f} {'-':>10} {'-':>9} ")
+              + f"{peak:>10} {delta:>8}")
+        if "reason" in result:
+            print(f"{'':<22} {result['reason']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling benchmarks of the pipeline on synthetic corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="number of papers of each corpus")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--timeout", type=float, default=900, help="seconds before a stage is killed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="results to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--child", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", help=argparse.SUPPRESS)
+    parser.add_argument("--metrics", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.corpus, args.metrics)
+        return
+
+    baseline = load_json(args.baseline) if os.path.exists(args.baseline) else {}
+    results = run_benchmarks(args.sizes, args.stages, args.timeout, args.seed)
+    with open(LAST_RUN_FILE, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print_report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({**baseline, **results}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import random
+from datetime import date, timedelta
+from itertools import product
+
+# Vocabulary of each synthetic research area, used for titles, abstracts and topics
+TOPICS = {
+    "learning": ["learning", "students", "education", "teaching", "classroom", "course", "online", "blended",
+                 "curriculum", "assessment", "skills", "teachers", "school", "university", "motivation",
+                 "feedback", "discussion", "media", "platform", "engagement"],
+    "language": ["language", "model", "transformer", "attention", "tokens", "translation", "corpus", "benchmark",
+                 "pretraining", "finetuning", "generation", "text", "reasoning", "prompt", "evaluation",
+                 "embedding", "decoder", "encoder", "multilingual", "instruction"],
+    "health": ["health", "patients", "clinical", "care", "nursing", "hospital", "treatment", "disease",
+               "covid", "symptoms", "diagnosis", "medical", "risk", "mortality", "cohort", "trial",
+               "nutrition", "diet", "therapy", "outcomes"],
+    "semantic": ["ontology", "graph", "knowledge", "linked", "data", "semantic", "rdf", "query", "sparql",
+                 "vocabulary", "metadata", "interoperability", "reasoning", "triples", "mapping", "schema",
+                 "integration", "annotation", "provenance", "fair"],
+    "vision": ["image", "vision", "convolutional", "segmentation", "detection", "pixels", "camera", "video",
+               "recognition", "features", "resolution", "depth", "object", "scene", "tracking", "pose",
+               "augmentation", "dataset", "labels", "classification"],
+    "social": ["social", "network", "users", "community", "platform", "decentralized", "federated", "posts",
+               "moderation", "behavior", "survey", "interaction", "influence", "trust", "privacy",
+               "communication", "online", "public", "policy", "media"],
+}
+
+COMMON = ["the", "of", "and", "in", "to", "a", "is", "this", "study", "we", "results", "show", "that",
+          "approach", "method", "analysis", "based", "using", "proposed", "paper", "new", "our", "with",
+          "for", "on", "are", "performance", "system", "evaluate", "present"]
+
+FIRST_NAMES = ["Ana", "Luis", "Maria", "Jose", "Laura", "Pablo", "Elena", "Carlos", "Lucia", "Javier",
+               "Sofia", "Diego", "Marta", "Alvaro", "Irene", "Sergio", "Paula", "Daniel", "Clara", "Hugo",
+               "Wei", "Yuki", "Amir", "Fatima", "Olga", "Ivan", "Nadia", "Kofi", "Priya", "Omar"]
+LAST_NAMES = ["Garcia", "Martinez", "Lopez", "Sanchez", "Perez", "Gomez", "Fernandez", "Ruiz", "Diaz",
+              "Moreno", "Alonso", "Romero", "Navarro", "Torres", "Dominguez", "Vazquez", "Ramos", "Gil",
+              "Serrano", "Molina", "Chen", "Tanaka", "Rahman", "Haddad", "Petrova", "Novak", "Mensah",
+              "Sharma", "Khan", "Silva"]
+CITIES = ["Madrid", "Barcelona", "Valencia", "Sevilla", "Bilbao", "Lisbon", "Paris", "Berlin", "Rome",
+          "Vienna", "Prague", "Warsaw", "Oslo", "Dublin", "Boston", "Toronto", "Tokyo", "Seoul", "Delhi",
+          "Nairobi", "Lima", "Bogota", "Santiago", "Sydney"]
+INSTITUTION_KINDS = ["University", "Institute of Technology", "Research Council", "Medical Center",
+                     "National Laboratory", "School of Engineering"]
+FUNDERS = ["Research Agency", "Science Foundation", "Innovation Fund", "Health Institute", "Digital Programme"]
+
+
+def _person_names(rng, count):
+    combos = list(product(FIRST_NAMES, LAST_NAMES))
+    rng.shuffle(combos)
+    names = []
+    for k in range(count):
+        first, last = combos[k % len(combos)]
+        # Past the plain combinations, a middle initial keeps the names unique
+        repeat = k // len(combos)
+        middle = "" if repeat == 0 else f" {chr(ord('A') + (repeat - 1) % 26)}{(repeat - 1) // 26 or ''}."
+        names.append(f"{first}{middle} {last}")
+    return names
+
+
+def _institution_names(count):
+    combos = [f"{kind} of {city}" for city, kind in product(CITIES, INSTITUTION_KINDS)]
+    return [combos[k % len(combos)] + ("" if k < len(combos) else f" {k // len(combos) + 1}")
+            for k in range(count)]
+
+
+def _entity_id(name):
+    return name.replace(".", "").replace(" ", "_")
+
+
+def _sentence(rng, vocabulary, length):
+    words = rng.choices(vocabulary, k=length)
+    return " ".join(words).capitalize() + "."
+
+
+def generate_corpus(n_papers, output_dir, seed=0, similar_per_paper=10):
+    """Writes a synthetic corpus of `n_papers` with every results file of the pipeline
+
+    The files have the same layout as the ones in `results/`:
+    `results.json` (titles, abstracts and acknowledgements, the input of the
+    analysis stages) and the outputs of those stages, so each stage can be
+    measured on its own. Similarity keeps `similar_per_paper` papers of the
+    same area per paper instead of every pair.
+
+    Args:
+        n_papers (int): number of papers.
+        output_dir (str): directory where the files are written.
+        seed (int, optional): seed of the generator, same seed same corpus.
+        similar_per_paper (int, optional): similarity links per paper.
+
+    Returns:
+        dict: number of records written per file.
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    areas = list(TOPICS)
+
+    authors = _person_names(rng, max(10, n_papers // 2))
+    institutions = _institution_names(max(5, n_papers // 20))
+    author_institution = {author: rng.choice(institutions) for author in authors}
+
+    papers, papers_info, acknowledgments, topics_prob = [], [], [], []
+    by_area = {area: [] for area in areas}
+    for i in range(n_papers):
+        area = rng.choice(areas)
+        other = rng.choice(areas)
+        by_area[area].append(i)
+        # Mostly words of the area of the paper, some of another one and filler words
+        vocabulary = TOPICS[area] * 4 + TOPICS[other] + COMMON * 2
+
+        title = " ".join(rng.choices(TOPICS[area], k=rng.randint(5, 9))).capitalize()
+        abstract = " ".join(_sentence(rng, vocabulary, rng.randint(12, 25)) for _ in range(rng.randint(5, 9)))
+
+        people = rng.sample(authors, k=rng.randint(1, 2))
+        organizations = [rng.choice(institutions), f"{rng.choice(CITIES)} {rng.choice(FUNDERS)}"]
+        city = rng.choice(CITIES)
+        acknowledgment = (f"We thank {people[0]} for the helpful comments"
+                          + (f" and {people[1]} for the support" if len(people) > 1 else "")
+                          + f". This work was carried out at the {organizations[0]} in {city}"
+                          + f" and funded by the {organizations[1]} under grant {rng.randint(1000, 99999)}.")
+        papers.append({"id": i, "title": title, "abstract": abstract, "acknowledgment": acknowledgment})
+        acknowledgments.append({"ID": i, "PER": [_entity_id(p) for p in people],
+                                "ORG": [_entity_id(o) for o in organizations],
+                                "LOC": [city], "MISC": []})
+
+        paper_authors = rng.sample(authors, k=rng.randint(1, 5))
+        papers_info.append({
+            "id": i,
+            "doi": f"https://doi.org/10.5555/synthetic.{i}",
+            "title": title,
+            "language": "en",
+            "publication_date": (date(2010, 1, 1) + timedelta(days=rng.randint(0, 5000))).isoformat(),
+            "authors": [_entity_id(a) for a in paper_authors],
+            "institutions": sorted({_entity_id(author_institution[a]) for a in paper_authors}),
+        })
+        topics_prob.append({"id": i, "topic_id": areas.index(area), "topic_prob": round(rng.uniform(0.4, 0.99), 6)})
+
+    similarity = []
+    for area, members in by_area.items():
+        for i in members:
+            for j in rng.sample(members, k=min(similar_per_paper + 1, len(members))):
+                if j != i:
+                    similarity.append({"from": i, "to": j, "similarity": round(rng.uniform(0.0001, 1.0), 6)})
+
+    files = {
+        "results": papers,
+        "similarity_results": similarity,
+        "topics": [{"id": k, "words": ", ".join(TOPICS[area][:10])} for k, area in enumerate(areas)],
+        "topics_prob": topics_prob,
+        "acknowledgment": acknowledgments,
+        "papers_info": papers_info,
+        "authors_info": [{"id": _entity_id(a), "name": a, "institutions": [_entity_id(author_institution[a])]}
+                         for a in authors],
+        "institutions_info": [{"id": _entity_id(name), "name": name} for name in institutions],
+    }
+    for name, records in files.items():
+        with open(os.path.join(output_dir, f"{name}.json"), 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False)
+    return {name: len(records) for name, records in files.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic corpus with the results files of the pipeline")
+    parser.add_argument("papers", type=int, help="number of papers")
+    parser.add_argument("--output", default=None, help="output directory (default benchmarks/data/<papers>)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(os.path.dirname(__file__), "data", str(args.papers))
+    counts = generate_corpus(args.papers, output, args.seed)
+    print(f"Corpus written to {output}: " + ", ".join(f"{name} {count}" for name, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
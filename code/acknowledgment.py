@@ -2,10 +2,6 @@ import requests
 import json
 import re
 
-# Load model directly
-from transformers import AutoTokenizer, AutoModelForTokenClassification
-from transformers import pipeline
-
 def load_results(file_path):
     """
     Load paper results from a JSON file.
@@ -64,6 +60,10 @@ def filtrar_entidades_por_score_y_etiquetas(lista, score_umbral, acknowledgment,
     return output
 
 def main():
+    # Load model directly
+    from transformers import AutoTokenizer, AutoModelForTokenClassification
+    from transformers import pipeline
+
     results_json_file = 'results/results.json'
     acknowledgment_json_file = 'results/acknowledgment.json'
 
@@ -0,0 +1,261 @@
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from hashlib import sha256
+
+# Stages of the pipeline. `inputs` and `outputs` are paths (or glob patterns)
+# relative to the repository root, where every script is executed.
+Stage = namedtuple('Stage', ['name', 'script', 'args', 'inputs', 'outputs', 'deps'])
+
+STAGES = [
+    Stage("grobid", "code/grobid.py", [],
+          ["papers/*.pdf"], ["results/results.json"], []),
+    Stage("similarity", "code/similarity.py", [],
+          ["results/results.json"], ["results/similarity_results.json"], ["grobid"]),
+    Stage("topic", "code/topic.py", [],
+          ["results/results.json"], ["results/topics.json", "results/topics_prob.json"], ["grobid"]),
+    Stage("acknowledgment", "code/acknowledgment.py", [],
+          ["results/results.json"], ["results/acknowledgment.json"], ["grobid"]),
+    Stage("openalex_openaire", "code/openalex_openaire.py", [],
+          ["results/results.json"],
+          ["results/papers_info.json", "results/authors_info.json", "results/institutions_info.json"],
+          ["grobid"]),
+    Stage("rdf", "code/rdf_generator.py", ["--results", "results", "--output", "app/output.ttl", "--incremental"],
+          ["results/*_info.json", "results/similarity_results.json", "results/topics.json",
+           "results/topics_prob.json", "results/acknowledgment.json"],
+          ["app/output.ttl"],
+          ["similarity", "topic", "acknowledgment", "openalex_openaire"]),
+]
+
+STATE_FILE = "results/.pipeline_state.json"
+LOG_DIR = "results/logs"
+
+StageResult = namedtuple('StageResult', ['name', 'status', 'wall_s', 'peak_mb', 'digest'])
+
+
+def _expand(patterns):
+    paths = []
+    for pattern in patterns:
+        paths.extend(sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern])
+    return paths
+
+
+def stage_digest(stage):
+    """Hash of everything a stage depends on: its script, arguments and inputs
+
+    Args:
+        stage (Stage): stage of the pipeline.
+
+    Returns:
+        str: hex sha256 digest. Missing inputs are hashed as missing, so they
+        produce a different digest than any existing file.
+    """
+    hasher = sha256()
+    hasher.update(json.dumps([stage.script, stage.args]).encode("utf-8"))
+    for path in [stage.script] + _expand(stage.inputs):
+        hasher.update(path.encode("utf-8") + b"\0")
+        if not os.path.exists(path):
+            hasher.update(b"<missing>")
+            continue
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                hasher.update(chunk)
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def load_state(path=STATE_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state, path=STATE_FILE):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def run_stage(stage, log_dir=LOG_DIR, timeout=None):
+    """Runs the script of a stage in a child process
+
+    The output of the script goes to `<log_dir>/<stage>.log`, so the stages
+    running at the same time do not mix their output.
+
+    Args:
+        stage (Stage): stage to run.
+        log_dir (str, optional): directory of the stage logs.
+        timeout (float, optional): seconds after which the child is killed.
+
+    Returns:
+        tuple: (exit code, wall time in seconds, peak RSS in MB or None when
+        the platform does not report it). A killed child has a negative code.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    start = time.perf_counter()
+    deadline = None if timeout is None else start + timeout
+    with open(os.path.join(log_dir, f"{stage.name}.log"), 'w', encoding='utf-8') as log:
+        process = subprocess.Popen([sys.executable, stage.script] + stage.args,
+                                   stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, "wait4"):
+            # Reap the child ourselves to get its resource usage
+            while True:
+                pid, status, usage = os.wait4(process.pid, 0 if deadline is None else os.WNOHANG)
+                if pid:
+                    break
+                if time.perf_counter() >= deadline:
+                    process.kill()
+                    deadline = None
+                else:
+                    time.sleep(0.05)
+            process.returncode = os.waitstatus_to_exitcode(status)
+            peak_mb = usage.ru_maxrss / 1024  # KiB on Linux
+            if sys.platform == "darwin":
+                peak_mb /= 1024  # bytes on macOS
+        else:
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            peak_mb = None
+    return process.returncode, time.perf_counter() - start, peak_mb
+
+
+def is_fresh(stage, digest, state):
+    return state.get(stage.name) == digest and all(os.path.exists(path) for path in stage.outputs)
+
+
+def run_pipeline(stages=STAGES, force=(), jobs=4, dry_run=False, state_path=STATE_FILE):
+    """Runs the stages in dependency order, skipping the up to date ones
+
+    A stage is up to date when the digest of its script and inputs matches
+    the one recorded after its last successful run and its outputs exist.
+    Stages whose dependencies are done run concurrently, up to `jobs`.
+    Since the inputs of a stage are the outputs of the previous ones, a
+    stage that runs again but produces the same files does not invalidate
+    the stages after it.
+
+    Args:
+        stages (list[Stage], optional): stages of the pipeline.
+        force (iterable, optional): names of the stages to run even if they
+            are up to date.
+        jobs (int, optional): maximum number of stages running at once.
+        dry_run (bool, optional): only report which stages would run.
+        state_path (str, optional): file with the digests of the last runs.
+
+    Returns:
+        list[StageResult]: one result per stage, in completion order.
+    """
+    names = {stage.name for stage in stages}
+    unknown = [dep for stage in stages for dep in stage.deps if dep not in names]
+    if unknown:
+        raise ValueError(f"Unknown dependencies: {unknown}")
+    force = set(force)
+    state = load_state(state_path)
+    pending = list(stages)
+    done, results = {}, []
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for stage in list(pending):
+                if any(dep not in done for dep in stage.deps):
+                    continue
+                pending.remove(stage)
+                if any(done[dep] in ("failed", "blocked") for dep in stage.deps):
+                    done[stage.name] = "blocked"
+                    results.append(StageResult(stage.name, "blocked", 0.0, None, None))
+                    continue
+                # Inputs are only complete once the dependencies are done
+                digest = stage_digest(stage)
+                if stage.name not in force and is_fresh(stage, digest, state):
+                    done[stage.name] = "cached"
+                    results.append(StageResult(stage.name, "cached", 0.0, None, digest))
+                elif dry_run:
+                    done[stage.name] = "stale"
+                    results.append(StageResult(stage.name, "stale", 0.0, None, digest))
+                else:
+                    print(f"[{stage.name}] running {stage.script}")
+                    running[pool.submit(run_stage, stage)] = (stage, digest)
+
+            if not running:
+                if pending and all(any(dep not in done for dep in stage.deps) for stage in pending):
+                    raise ValueError(f"Dependency cycle between {[stage.name for stage in pending]}")
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, digest = running.pop(future)
+                code, wall_s, peak_mb = future.result()
+                if code == 0:
+                    # The digest is taken before the run: if the inputs changed
+                    # meanwhile, the next run sees it and runs the stage again
+                    state[stage.name] = digest
+                    save_state(state, state_path)
+                    status = "ran"
+                else:
+                    status = "failed"
+                    print(f"[{stage.name}] failed with exit code {code}, see {LOG_DIR}/{stage.name}.log")
+                done[stage.name] = status
+                results.append(StageResult(stage.name, status, wall_s, peak_mb, digest))
+    return results
+
+
+def mark_fresh(stages=STAGES, state_path=STATE_FILE):
+    """Records the current outputs as up to date without running anything
+
+    Useful when the results were produced before the orchestrator existed.
+    Stages are expected in dependency order, as in `STAGES`.
+    """
+    state = load_state(state_path)
+    for stage in stages:
+        if all(os.path.exists(path) for path in stage.outputs):
+            state[stage.name] = stage_digest(stage)
+    save_state(state, state_path)
+    return state
+
+
+def print_report(results):
+    print(f"{'stage':<20} {'status':<8} {'wall (s)':>9} {'peak (MB)':>10}")
+    for result in results:
+        peak = "-" if result.peak_mb is None else f"{result.peak_mb:.1f}"
+        print(f"{result.name:<20} {result.status:<8} {result.wall_s:>9.2f} {peak:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the stages of the pipeline that are out of date")
+    parser.add_argument("--force", nargs="*", metavar="STAGE",
+                        help="run these stages even if they are up to date (all when no stage is given)")
+    parser.add_argument("--jobs", type=int, default=4, help="stages running at the same time")
+    parser.add_argument("--dry-run", action="store_true", help="only show which stages are out of date")
+    parser.add_argument("--mark-fresh", action="store_true",
+                        help="record the existing results as up to date and exit")
+    args = parser.parse_args()
+
+    if args.mark_fresh:
+        print(f"Marked as up to date: {', '.join(mark_fresh())}")
+        return
+
+    force = args.force or []
+    if args.force == []:
+        force = [stage.name for stage in STAGES]
+
+    results = run_pipeline(force=force, jobs=args.jobs, dry_run=args.dry_run)
+    print_report(results)
+    if any(result.status in ("failed", "blocked") for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+import argparse
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from hashlib import blake2b, sha256
+
+# Same vocabulary and IRI templates as mappings/transformations.ttl
+BASE = "https://papers.knowledgegraph.org/v1/"
+ONTO = "http://upm.ontology.es/papers#"
+XSD = "http://www.w3.org/2001/XMLSchema#"
+RDF_TYPE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#type"
+
+PREFIXES = {"onto": ONTO, "xsd": XSD}
+
+RESULT_FILES = {
+    "papers": "papers_info",
+    "similarity": "similarity_results",
+    "topics": "topics",
+    "topics_prob": "topics_prob",
+    "acknowledgment": "acknowledgment",
+    "authors": "authors_info",
+    "institutions": "institutions_info",
+}
+
+# Characters kept as they are in template values (R2RML IRI-safe encoding)
+_IRI_SAFE = set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+
+
+def iter_records(path, chunk_size=1 << 16):
+    """Streams the objects of a JSON array or of a JSON Lines file
+
+    Numbers are kept as their original text, so ids and scores are written
+    exactly as they appear in the results files.
+
+    Args:
+        path (str): Path to a `.json` (array) or `.jsonl` file.
+        chunk_size (int, optional): Characters read at a time.
+
+    Returns:
+        Iterator[dict]: the records, one at a time.
+    """
+    decoder = json.JSONDecoder(parse_float=str, parse_int=str)
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ""
+        pos = 0
+        eof = False
+        while True:
+            # Skip the separators between records: whitespace, '[', ',' and ']'
+            while pos < len(buffer) and buffer[pos] in " \t\r\n[,]":
+                pos += 1
+            if pos == len(buffer):
+                if eof:
+                    return
+                buffer, pos = f.read(chunk_size), 0
+                eof = not buffer
+                continue
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            if end == len(buffer) and not eof:
+                # A number at the end of the buffer may continue in the next chunk
+                more = f.read(chunk_size)
+                if more:
+                    buffer, pos = buffer[pos:] + more, 0
+                    continue
+                eof = True
+            yield record
+            pos = end
+
+
+def source_path(results_dir, name):
+    """Path of a results file, preferring its JSON Lines version if present"""
+    base = os.path.join(results_dir, RESULT_FILES[name])
+    return base + ".jsonl" if os.path.exists(base + ".jsonl") else base + ".json"
+
+
+def iri(template_path, value):
+    encoded = "".join(c if c in _IRI_SAFE or ord(c) > 127 else "".join(f"%{b:02X}" for b in c.encode("utf-8"))
+                      for c in str(value))
+    return f"<{BASE}{template_path}{encoded}>"
+
+
+def literal(value, datatype=None):
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r")
+    if datatype is None:
+        return f'"{text}"'
+    return f'"{text}"^^<{XSD}{datatype}>'
+
+
+def onto(name):
+    return f"<{ONTO}{name}>"
+
+
+def _present(record, key):
+    return record.get(key) is not None
+
+
+def _digest(*records):
+    # repr of the parsed records: much cheaper than a canonical JSON dump, and
+    # a different key order only means the subject is built again
+    return blake2b(repr(records).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class Indexes:
+    """Hash indexes of the parent sides of the mapping joins"""
+
+    def __init__(self, results_dir):
+        self.similarity = defaultdict(list)      # from -> [similarity record]
+        self.assignments = defaultdict(list)     # paper id -> [topics_prob record]
+        self.acknowledgments = defaultdict(list)  # paper ID -> [acknowledgment record]
+        self.topics = {}                          # topic id -> topic record
+
+        for record in iter_records(source_path(results_dir, "similarity")):
+            if _present(record, "from"):
+                self.similarity[record["from"]].append(record)
+        for record in iter_records(source_path(results_dir, "topics")):
+            if _present(record, "id"):
+                self.topics[record["id"]] = record
+        for record in iter_records(source_path(results_dir, "topics_prob")):
+            if _present(record, "id"):
+                self.assignments[record["id"]].append(record)
+        for record in iter_records(source_path(results_dir, "acknowledgment")):
+            if _present(record, "ID"):
+                self.acknowledgments[record["ID"]].append(record)
+
+
+def paper_triples(paper, indexes):
+    """Triples of the PaperObject map for one `papers_info` record"""
+    paper_id = paper["id"]
+    s = iri("paper/", paper_id)
+    triples = [(s, f"<{RDF_TYPE}>", onto("Paper"))]
+    if _present(paper, "language"):
+        triples.append((s, onto("hasLanguage"), literal(paper["language"])))
+    if _present(paper, "doi"):
+        triples.append((s, onto("hasDOI"), literal(paper["doi"], "anyURI")))
+    if _present(paper, "publication_date"):
+        triples.append((s, onto("hasPublicationDate"), literal(paper["publication_date"], "date")))
+    for similarity in indexes.similarity.get(paper_id, []):
+        if _present(similarity, "to"):
+            triples.append((s, onto("hasSimilarity"), iri("similarity/", f"{similarity['from']}-{similarity['to']}")))
+    if _present(paper, "title"):
+        triples.append((s, onto("hasTitle"), literal(paper["title"])))
+    for institution in paper.get("institutions") or []:
+        triples.append((s, onto("hasAuthor"), iri("institutions/", institution)))
+    for author in paper.get("authors") or []:
+        triples.append((s, onto("hasAuthor"), iri("author/", author)))
+    for assignment in indexes.assignments.get(paper_id, []):
+        if _present(assignment, "topic_id"):
+            triples.append((s, onto("hasTopic"), iri("topic-assig/", f"{assignment['id']}-{assignment['topic_id']}")))
+    return triples
+
+
+def acknowledgment_triples(ack_id, indexes):
+    """Triples of the Acknowledgements map for the paper `ack_id`"""
+    s = iri("paper/", ack_id)
+    triples = []
+    for record in indexes.acknowledgments.get(ack_id, []):
+        for organization in record.get("ORG") or []:
+            triples.append((s, onto("acknowledge"), iri("institutions/", organization)))
+        for person in record.get("PER") or []:
+            triples.append((s, onto("acknowledge"), iri("author/", person)))
+    return triples
+
+
+def similarity_triples(record):
+    s = iri("similarity/", f"{record['from']}-{record['to']}")
+    triples = [(s, f"<{RDF_TYPE}>", onto("SimilarityPaper"))]
+    if _present(record, "similarity"):
+        triples.append((s, onto("score"), literal(record["similarity"], "float")))
+    # The mapping gives this template the xsd:URI datatype, hence a literal
+    triples.append((s, onto("isSimilarTo"), literal(f"{BASE}paper/{record['to']}", "URI")))
+    return triples
+
+
+def assignment_triples(record, indexes):
+    s = iri("topic-assig/", f"{record['id']}-{record['topic_id']}")
+    triples = [(s, f"<{RDF_TYPE}>", onto("TopicAssign"))]
+    if record["topic_id"] in indexes.topics:
+        triples.append((s, onto("assign"), iri("topic/", record["topic_id"])))
+    if _present(record, "topic_prob"):
+        triples.append((s, onto("score"), literal(record["topic_prob"], "float")))
+    return triples
+
+
+def topic_triples(record):
+    s = iri("topic/", record["id"])
+    triples = [(s, f"<{RDF_TYPE}>", onto("Topic"))]
+    if _present(record, "words"):
+        # xsd:string in the mapping; RDF 1.1 writes it as a simple literal
+        triples.append((s, onto("hasWords"), literal(record["words"])))
+    return triples
+
+
+def author_triples(record):
+    s = iri("author/", record["id"])
+    triples = [(s, f"<{RDF_TYPE}>", onto("Person"))]
+    for institution in record.get("institutions") or []:
+        triples.append((s, onto("isMemberOf"), iri("institutions/", institution)))
+    if _present(record, "name"):
+        triples.append((s, onto("hasName"), literal(record["name"])))
+    return triples
+
+
+def institution_triples(record):
+    s = iri("institutions/", record["id"])
+    triples = [(s, f"<{RDF_TYPE}>", onto("Organization"))]
+    if _present(record, "name"):
+        triples.append((s, onto("hasName"), literal(record["name"])))
+    return triples
+
+
+def subjects(results_dir):
+    """Yields `(subject, digest, build)` for every subject of the graph
+
+    `digest` hashes the source records the subject is built from and
+    `build()` returns its triples, so unchanged subjects can be skipped.
+    """
+    indexes = Indexes(results_dir)
+
+    seen_papers = set()
+    for paper in iter_records(source_path(results_dir, "papers")):
+        if not _present(paper, "id"):
+            continue
+        paper_id = paper["id"]
+        seen_papers.add(paper_id)
+        digest = _digest(paper, indexes.similarity.get(paper_id, []), indexes.assignments.get(paper_id, []),
+                         indexes.acknowledgments.get(paper_id, []))
+        yield (iri("paper/", paper_id), digest,
+               lambda paper=paper: paper_triples(paper, indexes) + acknowledgment_triples(paper["id"], indexes))
+
+    # Acknowledgements of papers missing from papers_info
+    for ack_id, records in indexes.acknowledgments.items():
+        if ack_id not in seen_papers:
+            yield iri("paper/", ack_id), _digest(records), lambda ack_id=ack_id: acknowledgment_triples(ack_id, indexes)
+
+    for records in indexes.similarity.values():
+        for record in records:
+            if _present(record, "to"):
+                yield (iri("similarity/", f"{record['from']}-{record['to']}"), _digest(record),
+                       lambda record=record: similarity_triples(record))
+
+    for records in indexes.assignments.values():
+        for record in records:
+            if _present(record, "topic_id"):
+                topic = indexes.topics.get(record["topic_id"])
+                yield (iri("topic-assig/", f"{record['id']}-{record['topic_id']}"), _digest(record, topic),
+                       lambda record=record: assignment_triples(record, indexes))
+
+    for record in indexes.topics.values():
+        yield iri("topic/", record["id"]), _digest(record), lambda record=record: topic_triples(record)
+
+    for record in iter_records(source_path(results_dir, "authors")):
+        if _present(record, "id"):
+            yield iri("author/", record["id"]), _digest(record), lambda record=record: author_triples(record)
+
+    for record in iter_records(source_path(results_dir, "institutions")):
+        if _present(record, "id"):
+            yield iri("institutions/", record["id"]), _digest(record), lambda record=record: institution_triples(record)
+
+
+_LOCAL_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def _compact(term):
+    # Prefixed names for the vocabulary and datatypes, full IRIs otherwise
+    if term == f"<{RDF_TYPE}>":
+        return "a"
+    head, sep, datatype = term.rpartition("^^")
+    if sep:
+        return f"{head}^^{_compact(datatype)}"
+    for prefix, namespace in PREFIXES.items():
+        local = term[len(namespace) + 1:-1]
+        if term.startswith(f"<{namespace}") and _LOCAL_NAME.fullmatch(local):
+            return f"{prefix}:{local}"
+    return term
+
+
+def turtle_block(subject, triples):
+    by_predicate = {}
+    for _, p, o in triples:
+        by_predicate.setdefault(_compact(p), []).append(_compact(o))
+    lines = ";\n  ".join(f"{p} {', '.join(objects)}" for p, objects in by_predicate.items())
+    return f"{subject} {lines} .\n\n"
+
+
+def ntriples_block(triples):
+    return "".join(f"{s} {p} {o} .\n" for s, p, o in triples)
+
+
+def _code_version():
+    # Blocks built by another version of this script are not reused
+    with open(__file__, 'rb') as f:
+        return sha256(f.read()).hexdigest()
+
+
+def _state_header(output_format, size, mtime_ns):
+    # Fixed width, so it can be written once the output is complete
+    return f"# {_code_version()} {output_format:<3} {size:020d} {mtime_ns:020d}\n"
+
+
+def _load_state(state_path, output_path, output_format):
+    """Digest, offset and length of each subject block of the previous output
+
+    The state is only valid for the exact output file it was written with.
+    """
+    previous = {}
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            stat = os.stat(output_path)
+            if f.readline() != _state_header(output_format, stat.st_size, stat.st_mtime_ns):
+                return previous
+            for line in f:
+                digest, offset, length, subject = line.rstrip("\n").split("\t", 3)
+                previous[subject] = (digest, int(offset), int(length))
+    except (OSError, ValueError):
+        previous.clear()
+    return previous
+
+
+class _BlockCopier:
+    """Copies byte ranges of the previous output, merging contiguous ones"""
+
+    def __init__(self, source, out):
+        self.source, self.out = source, out
+        self.start = self.end = 0
+
+    def add(self, offset, length):
+        if offset != self.end:
+            self.flush()
+            self.start = offset
+        self.end = offset + length
+
+    def flush(self):
+        self.source.seek(self.start)
+        remaining = self.end - self.start
+        while remaining > 0:
+            chunk = self.source.read(min(remaining, 1 << 20))
+            if not chunk:
+                raise ValueError("previous output is shorter than its state")
+            self.out.write(chunk)
+            remaining -= len(chunk)
+        self.start = self.end = 0
+
+
+def generate(results_dir, output_path, output_format="ttl", incremental=False):
+    """Writes the knowledge graph built from the results files
+
+    Subjects are written as soon as they are built. With `incremental`, the
+    digest and byte range of each subject block are kept in
+    `<output_path>.state.tsv`; the blocks of unchanged subjects are copied
+    from the previous output instead of being built and serialized again.
+
+    Args:
+        results_dir (str): Directory with the results JSON/JSONL files.
+        output_path (str): Path of the generated graph.
+        output_format (str, optional): "ttl" (Turtle) or "nt" (N-Triples).
+        incremental (bool, optional): Reuse the unchanged subjects of the
+            previous run. Defaults to False.
+
+    Returns:
+        dict: number of subjects, rebuilt subjects and triples written
+        (triples of the copied subjects are not counted again).
+    """
+    state_path = f"{output_path}.state.tsv"
+    previous = {}
+    if incremental and os.path.exists(output_path):
+        previous = _load_state(state_path, output_path, output_format)
+
+    stats = {"subjects": 0, "rebuilt": 0, "triples": 0}
+    tmp_output, tmp_state = f"{output_path}.tmp", f"{state_path}.tmp"
+    with open(tmp_output, 'wb') as out, \
+            (open(output_path, 'rb') if previous else open(os.devnull, 'rb')) as source, \
+            (open(tmp_state, 'w', encoding='utf-8') if incremental else open(os.devnull, 'w')) as state:
+        copier = _BlockCopier(source, out)
+        if incremental:
+            state.write(_state_header(output_format, 0, 0))  # placeholder
+        offset = 0
+        if output_format == "ttl":
+            header = "".join(f"@prefix {prefix}: <{namespace}> .\n" for prefix, namespace in PREFIXES.items()) + "\n"
+            out.write(header.encode("utf-8"))
+            offset = len(header.encode("utf-8"))
+
+        for subject, digest, build in subjects(results_dir):
+            cached = previous.get(subject)
+            if cached is not None and cached[0] == digest:
+                length = cached[2]
+                copier.add(cached[1], length)
+            else:
+                copier.flush()
+                # Duplicated source values give the same triple once, as in a graph
+                triples = list(dict.fromkeys(build()))
+                if not triples:
+                    # e.g. acknowledgements without entities of a paper missing
+                    # from papers_info: "<s> ." alone is not valid Turtle
+                    continue
+                block = turtle_block(subject, triples) if output_format == "ttl" else ntriples_block(triples)
+                data = block.encode("utf-8")
+                out.write(data)
+                length = len(data)
+                stats["rebuilt"] += 1
+                stats["triples"] += len(triples)
+            stats["subjects"] += 1
+            if incremental:
+                state.write(f"{digest}\t{offset}\t{length}\t{subject}\n")
+            offset += length
+        copier.flush()
+
+    if incremental:
+        # The header ties the state to the exact output file just written
+        mtime_ns = time.time_ns()
+        os.utime(tmp_output, ns=(mtime_ns, mtime_ns))
+        with open(tmp_state, 'r+', encoding='utf-8') as state:
+            state.write(_state_header(output_format, offset, mtime_ns))
+    os.replace(tmp_output, output_path)
+    if incremental:
+        os.replace(tmp_state, state_path)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates the knowledge graph from the results files")
+    parser.add_argument("--results", default="results", help="directory with the results JSON/JSONL files")
+    parser.add_argument("--output", default="app/output.ttl", help="generated graph")
+    parser.add_argument("--format", default="ttl", choices=["ttl", "nt"], help="Turtle or N-Triples")
+    parser.add_argument("--incremental", action="store_true", help="only rebuild the subjects that changed")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    stats = generate(args.results, args.output, args.format, args.incremental)
+    print(f"{stats['subjects']} subjects ({stats['rebuilt']} rebuilt, {stats['triples']} triples built) "
+          f"written to {args.output} in {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
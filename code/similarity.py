@@ -1,7 +1,4 @@
-import torch
 import numpy as np
-import torch.nn.functional as F
-from transformers import AutoTokenizer, AutoModel
 
 from numpy.typing import NDArray
 from collections import namedtuple
@@ -31,6 +28,7 @@ def get_abstracts( path: str = ""):
     return abstracts
 
 def mean_pooling(model_output, attention_mask):
+    import torch
     token_embeddings = model_output[0] #First element of model_output contains all token embeddings
     input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
     return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
@@ -46,6 +44,9 @@ def get_embeddings(encoder, model, papers):
     Returns: 
         List[NDArray[float]]: list of text embeddings
     """
+    import torch
+    import torch.nn.functional as F
+
     vectors = []
     for paper in papers:
         abstract = paper['abstract']
@@ -91,6 +92,9 @@ def get_similar_papers(emb: List[NDArray], thress = 0.7) -> List[SimilarResult]:
     return results
 
 def main():
+    # The model libraries are only needed to compute the embeddings
+    from transformers import AutoTokenizer, AutoModel
+
     # Load data
     abstracts = get_abstracts()
 
@@ -10,11 +10,7 @@ import json
 import multiprocessing
 import numpy as np
 import random
-
-# Descargar las stopwords y el lematizador de NLTK
 import nltk
-nltk.download('stopwords')
-nltk.download('wordnet')
 
 def load_abstracts(json_file):
     """
@@ -123,6 +119,10 @@ def get_document_topics(lda_model, corpus):
 
 
 def main():
+    # Descargar las stopwords y el lematizador de NLTK
+    nltk.download('stopwords')
+    nltk.download('wordnet')
+
     # Define the location of the JSON file containing the abstracts
     abstracts_json_file = 'results/results.json'
     topics_json_file = 'results/topics.json'